@@ -1,10 +1,27 @@
+import os
+from typing import Optional, Tuple, Dict
+
 import click
 
+from skytemple_view_migration import profiling
+from skytemple_view_migration.cache import ParseCache, DISK_MAX_ENTRIES
 from skytemple_view_migration.collect_info import CollectInfo
-from skytemple_view_migration.output import p_info
+from skytemple_view_migration.files import GLADE_OVERRIDES
+from skytemple_view_migration.formatting import formatter_available
+from skytemple_view_migration.output import p_info, p_warn
 from skytemple_view_migration.phase_one import run_phase1
 from skytemple_view_migration.phase_three import run_phase3
-from skytemple_view_migration.phase_two import run_phase2
+from skytemple_view_migration.phase_two import run_phase2, RULES, OPTIONAL_RULE_NAMES
+from skytemple_view_migration.profiling import section
+from skytemple_view_migration.rules import select_rules
+from skytemple_view_migration.verify import run_verify
+from skytemple_view_migration.watch import watch as watch_controllers
+from skytemple_view_migration.writer import (
+    OutputWriter,
+    DryRunWriter,
+    StagingWriter,
+    STAGING_DIR_NAME,
+)
 
 
 @click.command()
@@ -13,35 +30,280 @@ from skytemple_view_migration.phase_two import run_phase2
 @click.option("--phase1/--no-phase1", default=True)
 @click.option("--phase2/--no-phase2", default=True)
 @click.option("--phase3/--no-phase3", default=True)
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes to analyze and generate widgets with.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Re-analyze and regenerate all controllers, even if they did not change.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Directory to keep parsed controllers in, shared between worker processes and runs.",
+)
+@click.option(
+    "--cache-max-entries",
+    default=DISK_MAX_ENTRIES,
+    type=click.IntRange(min=1),
+    help="Number of entries of each kind (parsed controllers, formatted widgets, "
+    "verification results) to keep in --cache-dir. Should be at least the number of "
+    "controllers.",
+)
+@click.option(
+    "--format",
+    "format_widgets",
+    is_flag=True,
+    help="Format generated widget modules with black, if it is installed.",
+)
+@click.option(
+    "--patch",
+    "patch_widgets",
+    is_flag=True,
+    help="Make widget modules by patching the changed parts of the controller source, "
+    "instead of unparsing them completely. Unchanged code keeps its formatting and comments.",
+)
+@click.option(
+    "--disable-rule",
+    "disabled_rules",
+    multiple=True,
+    type=click.Choice(OPTIONAL_RULE_NAMES),
+    help="Do not apply this rule when transforming controllers into widgets. "
+    "Can be given multiple times.",
+)
+@click.option(
+    "--verify",
+    is_flag=True,
+    help="Check all generated widgets before committing, without starting SkyTemple: "
+    "They must compile and match their .ui templates and must not use the builder anymore. "
+    "Nothing is committed if a check fails.",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Only report what would be written and deleted, without changing anything.",
+)
+@click.option(
+    "--diff",
+    is_flag=True,
+    help="With --dry-run: Print a unified diff of all changes instead of a summary.",
+)
+@click.option(
+    "--fsync",
+    is_flag=True,
+    help="fsync all generated files and their directories when committing them.",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Time all stages per entry and write a JSON report (and PROFILE.folded for flame graphs).",
+)
+@click.option(
+    "--module",
+    "modules",
+    multiple=True,
+    help="Only migrate controllers of this module. Can be given multiple times.",
+)
+@click.option(
+    "--glade-override",
+    "glade_overrides",
+    multiple=True,
+    help="MODULE/CONTROLLER=GLADE: Glade file name of a controller, if it differs from its own. "
+    "Can be given multiple times. rom/main=rom is always set.",
+    callback=lambda ctx, param, value: parse_glade_overrides(value),
+)
+@click.option(
+    "--non-interactive",
+    is_flag=True,
+    help="Never ask for fields that could not be collected or inferred. "
+    "Such controllers are reported and left out of Phase 2 and 3.",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="After Phase 1 and 2, keep running and re-migrate controllers whenever they "
+    "or their glade files change. Phase 3 is not run.",
+)
+@click.option(
+    "--watch-interval",
+    default=0.5,
+    type=click.FloatRange(min=0.05),
+    help="With --watch: Seconds between scans for changes.",
+)
 def main(
     skytemple_directory: str,
     collect_info_json: str,
     phase1: bool,
     phase2: bool,
     phase3: bool,
+    jobs: int,
+    force: bool,
+    cache_dir: Optional[str],
+    cache_max_entries: int,
+    format_widgets: bool,
+    patch_widgets: bool,
+    disabled_rules: Tuple[str, ...],
+    verify: bool,
+    dry_run: bool,
+    diff: bool,
+    fsync: bool,
+    profile: Optional[str],
+    modules: Tuple[str, ...],
+    glade_overrides: Dict[Tuple[str, str], str],
+    non_interactive: bool,
+    watch: bool,
+    watch_interval: float,
 ):
     """
     Convert controllers into widget views. Will collect data from all controllers,
     and then generate widgets and convert glade files to ui templates.
 
+    Controllers whose inputs and generated outputs did not change since the last
+    run are skipped, unless --force is given.
+
     Phases (can be skipped):
     - 1. Collecting:
       Collects all controllers and generates their names, entry points and `item_data` types.
+      What can not be found in the controller is inferred from the glade file and the
+      module package, if possible, otherwise it is asked for.
       Reads/Writes those to the collect_info_json JSON file.
     - 2. Generating:
       Generating widget UI files and Python widget modules.
     - 3. Cleaning:
       Delete old controllers and glade files.
+
+    With --verify all generated widgets are checked after that: They must compile,
+    their template children, callbacks and template class must match the .ui file
+    and no builder references may be left. Results are cached by the outputs.
+
+    All files are written to a staging directory in skytemple_directory first
+    and only moved into place once all phases succeeded. If that is interrupted,
+    the next run rolls the changes back.
+
+    Every analyzed and generated controller is saved to a journal next to
+    collect_info_json right away, which is merged into it at the end. If a run is
+    interrupted, the journal is picked up by the next one.
+
+    With --watch the controllers are watched for changes afterwards and Phase 1 and
+    (if enabled) 2 are re-run for every changed controller.
     """
-    collect_info = CollectInfo(collect_info_json)
-    if phase1:
-        run_phase1(skytemple_directory, collect_info)
-        p_info("Saving collect info.")
+    module_filter = set(modules) if len(modules) > 0 else None
+    if format_widgets and not formatter_available():
+        p_warn("black is not installed, widgets will not be formatted.")
+        format_widgets = False
+    rules = select_rules(RULES, disabled_rules)
+    collect_info = CollectInfo(collect_info_json, journal=not dry_run)
+    cache = ParseCache(directory=cache_dir, disk_max_entries=cache_max_entries)
+    writer: OutputWriter
+    if dry_run:
+        writer = DryRunWriter()
+    else:
+        writer = StagingWriter(
+            os.path.join(skytemple_directory, STAGING_DIR_NAME), fsync
+        )
+    profiler = profiling.enable() if profile is not None else None
+    try:
+        if phase1:
+            with section("phase1"):
+                run_phase1(
+                    skytemple_directory,
+                    collect_info,
+                    jobs,
+                    force,
+                    cache,
+                    module_filter,
+                    glade_overrides,
+                    not non_interactive,
+                )
+        if phase2:
+            with section("phase2"):
+                run_phase2(
+                    skytemple_directory,
+                    collect_info,
+                    jobs,
+                    force,
+                    cache,
+                    writer,
+                    module_filter,
+                    format_widgets,
+                    patch_widgets,
+                    rules,
+                )
+        if phase3 and watch:
+            p_info("Watching, skipping Phase 3.")
+        elif phase3:
+            with section("phase3"):
+                run_phase3(skytemple_directory, collect_info, writer, module_filter)
+        if verify:
+            with section("verify"):
+                failed = run_verify(
+                    skytemple_directory,
+                    collect_info,
+                    jobs,
+                    cache,
+                    writer,
+                    module_filter,
+                )
+            if failed > 0:
+                raise click.ClickException(
+                    f"{failed} widgets failed verification, nothing was committed."
+                )
+        with section("commit"):
+            writer.commit()
+        save_collect_info(collect_info, dry_run)
+        if watch:
+            watch_controllers(
+                skytemple_directory,
+                collect_info,
+                jobs,
+                cache,
+                writer,
+                module_filter,
+                glade_overrides,
+                watch_interval,
+                phase2,
+                not non_interactive,
+                format_widgets,
+                patch_widgets,
+                rules,
+            )
+            save_collect_info(collect_info, dry_run)
+    except BaseException:
+        writer.rollback()
+        raise
+    if isinstance(writer, DryRunWriter):
+        writer.report(diff)
+    if profiler is not None:
+        profiler.dump(str(profile))
+        profiler.print_top()
+
+
+def parse_glade_overrides(values: Tuple[str, ...]) -> Dict[Tuple[str, str], str]:
+    overrides = dict(GLADE_OVERRIDES)
+    for value in values:
+        try:
+            controller, glade = value.split("=", 1)
+            module_name, controller_name = controller.split("/", 1)
+        except ValueError:
+            raise click.BadParameter(f"Expected MODULE/CONTROLLER=GLADE, got {value}.")
+        overrides[(module_name, controller_name)] = glade
+    return overrides
+
+
+def save_collect_info(collect_info: CollectInfo, dry_run: bool):
+    if dry_run:
+        p_info("Dry run, not saving collect info.")
+        return
+    p_info("Saving collect info.")
+    with section("save collect info"):
         collect_info.dump()
-    if phase2:
-        run_phase2(skytemple_directory, collect_info)
-    if phase3:
-        run_phase3(skytemple_directory, collect_info)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+"""
+Runs the migration of a single controller on its source code and glade XML, without
+any file system access or output. The CLI does the same on the files of a SkyTemple
+directory.
+"""
+
+import copy
+import os
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Optional, List, Mapping, Sequence
+
+from skytemple_view_migration.cache import parse_controller_source, parse_glade_source
+from skytemple_view_migration.collect_info import CollectInfoEntry
+from skytemple_view_migration.formatting import formatter_available
+from skytemple_view_migration.inference import parse_module_sources
+from skytemple_view_migration.model import ControllerAndGlade
+from skytemple_view_migration.output import capture_warnings
+from skytemple_view_migration.phase_one import (
+    ControllerAnalysis,
+    analyze_controller_tree,
+    apply_analysis,
+    missing_fields,
+)
+from skytemple_view_migration.phase_two import (
+    GeneratedWidget,
+    generate_widget_from_trees,
+)
+from skytemple_view_migration.rules import Rule
+from skytemple_view_migration.util import content_hash
+from skytemple_view_migration.verify import verify_widget
+
+
+@dataclass
+class MigrationResult:
+    analysis: ControllerAnalysis
+    # The given entry (or a new one) with the analysis merged into it.
+    entry: CollectInfoEntry
+    # Fields that could neither be collected nor inferred. If there are any (or the
+    # controller was skipped), no widget was generated.
+    missing_fields: List[str]
+    widget_source: Optional[str] = None
+    ui_source: Optional[bytes] = None
+    warnings: List[str] = field(default_factory=list)
+
+
+def analyze(
+    controller_source: str,
+    glade_source: bytes,
+    module_name: str,
+    controller_name: str,
+    module_sources: Optional[Mapping[str, str]] = None,
+) -> ControllerAnalysis:
+    """
+    Phase 1 for a single controller. module_sources are the files of the module
+    package (file name -> source), used to infer the module class and item data type.
+    Warnings are collected in the result instead of being printed.
+    """
+    analysis = ControllerAnalysis(
+        ControllerAndGlade(
+            module_name,
+            controller_name,
+            _controller_path(module_name, controller_name),
+            _glade_path(module_name, controller_name),
+        )
+    )
+    analysis.controller_hash = content_hash(controller_source.encode("utf-8"))
+    analysis.glade_hash = content_hash(glade_source)
+    with capture_warnings() as warnings:
+        analyze_controller_tree(
+            analysis,
+            parse_controller_source(controller_source),
+            glade_source,
+            partial(parse_module_sources, module_name, module_sources or {}),
+        )
+    analysis.warnings = warnings
+    return analysis
+
+
+def generate(
+    entry: CollectInfoEntry,
+    controller_source: str,
+    glade_source: bytes,
+    format_widget: bool = False,
+    patch_widget: bool = False,
+    rules: Optional[Sequence[Rule]] = None,
+) -> GeneratedWidget:
+    """
+    Phase 2 for a single complete entry: Returns the widget module source and the UI
+    template. format_widget is ignored if black is not installed. If patch_widget is
+    set, the widget module is made by patching the controller source. rules default
+    to all RULES of phase_two.
+    """
+    with capture_warnings() as warnings:
+        widget_source, ui_source = generate_widget_from_trees(
+            entry,
+            parse_controller_source(controller_source),
+            parse_glade_source(glade_source),
+            glade_source,
+            format_widget=format_widget and formatter_available(),
+            controller_source=controller_source if patch_widget else None,
+            rules=rules,
+        )
+    return GeneratedWidget(widget_source, ui_source, warnings, None)
+
+
+def migrate(
+    controller_source: str,
+    glade_source: bytes,
+    module_name: str,
+    controller_name: str,
+    entry: Optional[CollectInfoEntry] = None,
+    module_sources: Optional[Mapping[str, str]] = None,
+    format_widget: bool = False,
+    patch_widget: bool = False,
+    rules: Optional[Sequence[Rule]] = None,
+) -> MigrationResult:
+    """
+    Phase 1 and 2 for a single controller. entry can provide fields that can not be
+    collected or inferred, as answers to the prompts of the CLI would. It is not modified.
+    """
+    analysis = analyze(
+        controller_source, glade_source, module_name, controller_name, module_sources
+    )
+    if entry is None:
+        entry = CollectInfoEntry(
+            module_name=module_name,
+            controller_name=controller_name,
+            glade_path=analysis.controller.glade_path,
+            controller_path=analysis.controller.controller_path,
+        )
+    else:
+        entry = copy.deepcopy(entry)
+    if analysis.skipped:
+        return MigrationResult(
+            analysis, entry, missing_fields(entry), warnings=analysis.warnings
+        )
+    apply_analysis(entry, analysis, glade_source)
+    missing = missing_fields(entry)
+    if len(missing) > 0:
+        return MigrationResult(analysis, entry, missing, warnings=analysis.warnings)
+
+    generated = generate(
+        entry, controller_source, glade_source, format_widget, patch_widget, rules
+    )
+    return MigrationResult(
+        analysis,
+        entry,
+        [],
+        generated.widget_source,
+        generated.ui_source,
+        analysis.warnings + generated.warnings,
+    )
+
+
+def verify(widget_source: str, ui_source: bytes) -> List[str]:
+    """The problems verification finds in a generated widget, empty if there are none."""
+    return verify_widget(widget_source.encode("utf-8"), ui_source)
+
+
+def _controller_path(module_name: str, controller_name: str) -> str:
+    return os.path.join(
+        "skytemple", "module", module_name, "controller", f"{controller_name}.py"
+    )
+
+
+def _glade_path(module_name: str, controller_name: str) -> str:
+    return os.path.join(
+        "skytemple", "module", module_name, "controller", f"{controller_name}.glade"
+    )
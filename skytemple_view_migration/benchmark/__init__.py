@@ -0,0 +1,251 @@
+import io
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from dataclasses import asdict
+from typing import Dict, List, Callable, Optional
+from xml.etree import ElementTree
+
+import click
+
+from skytemple_view_migration.benchmark.generate import (
+    CorpusConfig,
+    generate_corpus,
+    generate_collect_info,
+    generate_glade,
+)
+from skytemple_view_migration.cache import ParseCache, parse_glade_source
+from skytemple_view_migration.collect_info import CollectInfo, CollectInfoEntry
+from skytemple_view_migration.files import iter_controllers
+from skytemple_view_migration.phase_one import run_phase1
+from skytemple_view_migration.phase_three import run_phase3
+from skytemple_view_migration.phase_two import (
+    run_phase2,
+    transform_ui_source,
+    transform_ui_tree,
+)
+from skytemple_view_migration.ui_xml import GladeIndex
+from skytemple_view_migration.util import assert_not_none
+from skytemple_view_migration.verify import run_verify
+
+
+@click.command()
+@click.option("--modules", default=CorpusConfig.modules, type=int)
+@click.option("--controllers", default=CorpusConfig.controllers_per_module, type=int)
+@click.option("--widgets", default=CorpusConfig.widgets_per_glade, type=int)
+@click.option("--signals", default=CorpusConfig.signal_handlers, type=int)
+@click.option("--builder-calls", default=CorpusConfig.builder_calls, type=int)
+@click.option("--jobs", "-j", default=1, type=click.IntRange(min=1))
+@click.option("--repeat", default=3, type=click.IntRange(min=1))
+@click.option(
+    "--collect-info-entries",
+    default=10000,
+    type=click.IntRange(min=0),
+    help="Size of the collect info to time loading, saving and dumping of. 0 to skip.",
+)
+@click.option(
+    "--ui-widgets",
+    default=5000,
+    type=click.IntRange(min=0),
+    help="Number of widgets in the glade file to time and verify the .ui rewriting on. 0 to skip.",
+)
+@click.option(
+    "--patch",
+    "patch_widgets",
+    is_flag=True,
+    help="Make widget modules by patching the controller sources in Phase 2.",
+)
+@click.option(
+    "--output",
+    "-o",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="JSON file to save the results to.",
+)
+def main(
+    modules: int,
+    controllers: int,
+    widgets: int,
+    signals: int,
+    builder_calls: int,
+    jobs: int,
+    repeat: int,
+    collect_info_entries: int,
+    ui_widgets: int,
+    patch_widgets: bool,
+    output: Optional[str],
+):
+    """
+    Generates a synthetic SkyTemple tree and times the controller discovery, all three
+    phases and the verification of the widgets on it separately. Also times loading,
+    saving and dumping a large synthetic collect info and measures its memory use, and
+    compares rewriting a large glade file into a .ui template by streaming to doing it
+    on the parsed tree.
+    """
+    config = CorpusConfig(modules, controllers, widgets, signals, builder_calls)
+    timings: Dict[str, List[float]] = {}
+    for _ in range(repeat):
+        for name, seconds in run_once(config, jobs, patch_widgets).items():
+            timings.setdefault(name, []).append(seconds)
+        if collect_info_entries > 0:
+            for name, seconds in run_collect_info(collect_info_entries).items():
+                timings.setdefault(name, []).append(seconds)
+        if ui_widgets > 0:
+            for name, seconds in run_ui(ui_widgets).items():
+                timings.setdefault(name, []).append(seconds)
+    memory = None
+    if collect_info_entries > 0:
+        memory = collect_info_memory(collect_info_entries)
+
+    for name, values in timings.items():
+        click.echo(
+            f"{name:<20} min {min(values):8.3f}s  median {statistics.median(values):8.3f}s"
+        )
+    if memory is not None:
+        click.echo(
+            f"{'collect_info memory':<20} {memory / 1024 / 1024:8.3f}MiB for {collect_info_entries} entries"
+        )
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(
+                {
+                    "config": asdict(config),
+                    "jobs": jobs,
+                    "patch_widgets": patch_widgets,
+                    "collect_info_entries": collect_info_entries,
+                    "collect_info_memory": memory,
+                    "ui_widgets": ui_widgets,
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "timestamp": time.time(),
+                    "timings": timings,
+                },
+                f,
+                indent=2,
+            )
+
+
+def run_once(
+    config: CorpusConfig, jobs: int, patch_widgets: bool = False
+) -> Dict[str, float]:
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        collect_info_json = os.path.join(directory, "collect_info.json")
+        generate_corpus(directory, config, collect_info_json)
+        collect_info = CollectInfo(collect_info_json)
+        cache = ParseCache()
+
+        with redirect_stdout(io.StringIO()):
+            timings["iter_controllers"] = _timed(
+                lambda: list(iter_controllers(directory))
+            )
+            timings["phase1"] = _timed(
+                lambda: run_phase1(directory, collect_info, jobs, True, cache)
+            )
+            timings["phase2"] = _timed(
+                lambda: run_phase2(
+                    directory,
+                    collect_info,
+                    jobs,
+                    True,
+                    cache,
+                    patch_widgets=patch_widgets,
+                )
+            )
+            timings["verify"] = _timed(
+                lambda: run_verify(directory, collect_info, jobs, cache)
+            )
+            timings["phase3"] = _timed(lambda: run_phase3(directory, collect_info))
+    return timings
+
+
+def run_collect_info(entries: int) -> Dict[str, float]:
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        collect_info_json = os.path.join(directory, "collect_info.json")
+        generate_collect_info(collect_info_json, entries)
+        collect_info: Optional[CollectInfo] = None
+
+        def load():
+            nonlocal collect_info
+            collect_info = CollectInfo(collect_info_json)
+
+        timings["collect_info_load"] = _timed(load)
+        assert collect_info is not None
+        info = collect_info
+        values = list(info.entries.values())
+        with redirect_stdout(io.StringIO()):
+            timings["collect_info_save"] = _timed(
+                lambda: [info.save(entry) for entry in values]
+            )
+            timings["collect_info_dump"] = _timed(info.dump)
+    return timings
+
+
+def run_ui(widgets: int) -> Dict[str, float]:
+    """
+    Times turning the main widget of a large glade file into a template by rewriting
+    its tags in the source and by serializing the changed tree, and checks that both
+    give the same document.
+    """
+    config = CorpusConfig(widgets_per_glade=widgets)
+    glade_source = generate_glade(config)
+    entry = CollectInfoEntry(
+        module_name="module",
+        controller_name="controller",
+        glade_path="controller.glade",
+        controller_path="controller.py",
+        main_widget_name="main_box",
+        main_widget_type="Gtk.Box",
+        new_widget_name="StModuleControllerPage",
+    )
+    streamed = b""
+    serialized = io.BytesIO()
+
+    def stream():
+        nonlocal streamed
+        streamed = transform_ui_source(glade_source, entry)
+
+    def tree():
+        ui_tree = parse_glade_source(glade_source)
+        transform_ui_tree(GladeIndex(assert_not_none(ui_tree.getroot())), entry)
+        ui_tree.write(serialized, encoding="utf-8", xml_declaration=True)
+
+    timings = {"ui_stream": _timed(stream), "ui_tree": _timed(tree)}
+    if _canonical(streamed) != _canonical(serialized.getvalue()):
+        raise click.ClickException("Streamed and serialized .ui templates differ.")
+    return timings
+
+
+def _canonical(document: bytes) -> str:
+    """Canonical XML of the root element, with comments."""
+    root = assert_not_none(parse_glade_source(document).getroot())
+    return ElementTree.canonicalize(
+        ElementTree.tostring(root, encoding="unicode"), with_comments=True
+    )
+
+
+def collect_info_memory(entries: int) -> int:
+    """Bytes allocated for a loaded collect info with the given number of entries."""
+    with tempfile.TemporaryDirectory() as directory:
+        collect_info_json = os.path.join(directory, "collect_info.json")
+        generate_collect_info(collect_info_json, entries)
+        tracemalloc.start()
+        try:
+            collect_info = CollectInfo(collect_info_json)
+            memory, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del collect_info
+    return memory
+
+
+def _timed(fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
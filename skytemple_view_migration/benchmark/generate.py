@@ -0,0 +1,177 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import List, Dict, Any
+from xml.sax.saxutils import quoteattr
+
+from skytemple_view_migration.phase_one import new_widget_name
+
+WIDGET_CLASSES = ["GtkLabel", "GtkButton", "GtkEntry", "GtkSwitch", "GtkSpinButton"]
+
+
+@dataclass
+class CorpusConfig:
+    modules: int = 10
+    controllers_per_module: int = 10
+    widgets_per_glade: int = 50
+    signal_handlers: int = 10
+    builder_calls: int = 50
+
+
+def generate_corpus(directory: str, config: CorpusConfig, collect_info_json: str):
+    """
+    Generates a synthetic SkyTemple tree with controllers and glade files in directory,
+    including the rom/main.py -> rom.glade special case, and a complete collect info JSON
+    for it, so Phase 1 never has to prompt.
+    """
+    collect_info: Dict[str, Dict[str, Any]] = {}
+    controllers = [
+        (f"module{m}", f"controller{c}", f"controller{c}")
+        for m in range(config.modules)
+        for c in range(config.controllers_per_module)
+    ]
+    controllers.append(("rom", "main", "rom"))
+    for module_name, controller_name, glade_name in controllers:
+        controller_dir = os.path.join(
+            directory, "skytemple", "module", module_name, "controller"
+        )
+        os.makedirs(controller_dir, exist_ok=True)
+        controller_path = os.path.join(controller_dir, f"{controller_name}.py")
+        glade_path = os.path.join(controller_dir, f"{glade_name}.glade")
+        class_name = f"{controller_name[0].upper()}{controller_name[1:]}Controller"
+        module_class = f"{module_name[0].upper()}{module_name[1:]}Module"
+
+        with open(controller_path, "w") as f:
+            f.write(_controller_source(config, class_name, module_name, module_class))
+        with open(glade_path, "w") as f:
+            f.write(_glade_source(config))
+
+        collect_info[os.path.abspath(controller_path)] = {
+            "module_name": module_name,
+            "controller_name": controller_name,
+            "glade_path": os.path.abspath(glade_path),
+            "controller_path": os.path.abspath(controller_path),
+            "controller_class_name": class_name,
+            "module_class": module_class,
+            "main_widget_name": "main_box",
+            "main_widget_type": "Gtk.Box",
+            "item_data_type": "int",
+            "new_widget_name": new_widget_name(class_name, module_name),
+            "extra_init_params": [],
+        }
+
+    with open(collect_info_json, "w") as f:
+        json.dump(collect_info, f, indent=2)
+
+
+def generate_glade(config: CorpusConfig) -> bytes:
+    """A synthetic glade file with config.widgets_per_glade widgets in the GtkBox main_box."""
+    return _glade_source(config).encode("utf-8")
+
+
+def _widget_id(i: int) -> str:
+    return f"widget_{i}"
+
+
+def _controller_source(
+    config: CorpusConfig, class_name: str, module_name: str, module_class: str
+) -> str:
+    lines: List[str] = [
+        "# A synthetic controller.",
+        "from typing import TYPE_CHECKING, Optional",
+        "",
+        "from gi.repository import Gtk",
+        "",
+        "from skytemple.core.module_controller import AbstractController",
+        "from skytemple.core.ui_utils import builder_get_assert",
+        "",
+        "if TYPE_CHECKING:",
+        f"    from skytemple.module.{module_name}.module import {module_class}",
+        "",
+        "",
+        f"class {class_name}(AbstractController):",
+        f'    def __init__(self, module: "{module_class}", item_data: int):',
+        "        self.module = module",
+        "        self.item_data = item_data",
+        "        self.builder: Gtk.Builder = None  # type: ignore",
+        "",
+        "    def get_view(self) -> Gtk.Widget:",
+        '        self.builder = self._get_builder(__file__, "x.glade")',
+        "        assert self.builder",
+        "        self.builder.connect_signals(self)",
+    ]
+    for i in range(config.builder_calls):
+        widget = i % max(1, config.widgets_per_glade)
+        cls = WIDGET_CLASSES[widget % len(WIDGET_CLASSES)]
+        lines.append(
+            f'        builder_get_assert(self.builder, Gtk.{cls[3:]}, "{_widget_id(widget)}").show()'
+        )
+    lines += [
+        '        box = builder_get_assert(self.builder, Gtk.Box, "main_box")',
+        "        return box",
+    ]
+    for i in range(config.signal_handlers):
+        lines += [
+            "",
+            f"    def on_handler_{i}(self, *args):",
+            f"        # Handles signal {i}.",
+            f"        builder_get_assert(self.builder, Gtk.Label, {_widget_id(0)!r}).set_text({str(i)!r})",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def _glade_source(config: CorpusConfig) -> str:
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        "<!-- A synthetic glade file. -->",
+        "<interface>",
+        '  <requires lib="gtk+" version="3.20"/>',
+        '  <object class="GtkAdjustment" id="adjustment"/>',
+        '  <object class="GtkBox" id="main_box">',
+        '    <property name="visible">True</property>',
+    ]
+    for i in range(config.widgets_per_glade):
+        cls = WIDGET_CLASSES[i % len(WIDGET_CLASSES)]
+        lines += [
+            "    <child>",
+            f"      <object class={quoteattr(cls)} id={quoteattr(_widget_id(i))}>",
+            '        <property name="visible">True</property>',
+        ]
+        if i < config.signal_handlers:
+            lines.append(
+                f'        <signal name="activate" handler="on_handler_{i}" swapped="no"/>'
+            )
+        lines += ["      </object>", "    </child>"]
+    lines += ["  </object>", "</interface>"]
+    return "\n".join(lines) + "\n"
+
+
+def generate_collect_info(collect_info_json: str, entries: int):
+    """Writes a collect info JSON with the given number of complete synthetic entries."""
+    collect_info: Dict[str, Dict[str, Any]] = {}
+    for i in range(entries):
+        module_name = f"module{i // 100}"
+        controller_name = f"controller{i % 100}"
+        controller_dir = f"/skytemple/module/{module_name}/controller"
+        controller_path = f"{controller_dir}/{controller_name}.py"
+        class_name = f"Controller{i % 100}Controller"
+        collect_info[controller_path] = {
+            "module_name": module_name,
+            "controller_name": controller_name,
+            "glade_path": f"{controller_dir}/{controller_name}.glade",
+            "controller_path": controller_path,
+            "controller_class_name": class_name,
+            "module_class": f"Module{i // 100}Module",
+            "main_widget_name": "main_box",
+            "main_widget_type": "Gtk.Box",
+            "item_data_type": "int",
+            "new_widget_name": new_widget_name(class_name, module_name),
+            "extra_init_params": ["extra: int"] if i % 10 == 0 else [],
+            "controller_hash": f"{i:064x}",
+            "glade_hash": f"{i + 1:064x}",
+            "widget_hash": f"{i + 2:064x}",
+            "ui_hash": f"{i + 3:064x}",
+            "inferred": {"item_data_type": f"{module_name}/module.py:1"},
+        }
+    with open(collect_info_json, "w") as f:
+        json.dump(collect_info, f, indent=2)
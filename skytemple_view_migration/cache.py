@@ -0,0 +1,309 @@
+import ast
+import copy
+import hashlib
+import io
+import os
+import pickle
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple, Any, Callable, List, Dict
+from xml.etree import ElementTree
+
+import ast_comments
+
+from skytemple_view_migration.util import content_hash
+
+Stamp = Tuple[int, int]
+
+# Entries of each kind kept in the cache directory, by default. Unlike the memory,
+# it is meant to hold a whole corpus between runs.
+DISK_MAX_ENTRIES = 4096
+# Share of disk_max_entries that is kept when evicting, so the directory is only
+# scanned again after a lot of new entries.
+DISK_EVICT_TO = 0.75
+
+
+@dataclass
+class SourceFile:
+    """The content of a file that was read ahead, with its stamp from before the read."""
+
+    path: str
+    stamp: Stamp
+    content: bytes
+
+
+def read_source_file(path: str) -> SourceFile:
+    stamp = _stamp(path)
+    with open(path, "rb") as f:
+        return SourceFile(path, stamp, f.read())
+
+
+def decode_source(content: bytes) -> str:
+    """Decodes the content of a controller like open(path, "r") does."""
+    return io.TextIOWrapper(io.BytesIO(content)).read()
+
+
+def parse_controller(path: str) -> ast.AST:
+    with open(path, "r") as f:
+        return parse_controller_source(f.read())
+
+
+def parse_controller_source(source: str) -> ast.AST:
+    return ast_comments.parse(source)
+
+
+def parse_glade(path: str):
+    return ElementTree.parse(path, parser=_glade_parser())
+
+
+def parse_glade_source(source: bytes) -> ElementTree.ElementTree:
+    parser = _glade_parser()
+    parser.feed(source)
+    return ElementTree.ElementTree(parser.close())
+
+
+def _glade_parser() -> ElementTree.XMLParser:
+    return ElementTree.XMLParser(target=ElementTree.TreeBuilder(insert_comments=True))
+
+
+class ParseCache:
+    """
+    LRU cache of parsed controllers and glade files, keyed by path, mtime and size.
+    Every lookup returns a fresh copy (unless a shared glade tree is requested), so
+    callers may modify what they get.
+    If the file was already read (SourceFile), its content is parsed on a miss and
+    the file is not accessed again.
+
+    Controller ASTs are kept pickled, unpickling is a lot faster than parsing again.
+    If a directory is given, they are also stored there, so they can be shared with
+    worker processes and later runs. Glade trees are only kept in memory (and deep
+    copied), since expat parses them faster than they can be unpickled.
+    Formatted sources are cached by the content hash of the unformatted source (and
+    the formatter version) and
+    verification results by the content hash of the verified outputs, in memory and
+    in the directory.
+    The memory keeps max_entries entries, the directory disk_max_entries of each kind.
+    The entries in the directory are only counted once, after that by the writes of
+    this process. Once there are too many, the least recently used are evicted.
+    Worker processes share the directory and may evict entries another one is using,
+    so entries that vanish are treated as misses.
+
+    When pickled (to be sent to worker processes) only the settings are kept.
+    """
+
+    max_entries: int
+    directory: Optional[str]
+    disk_max_entries: int
+    _memory: "OrderedDict[Tuple[str, str], Tuple[Stamp, Any]]"
+    # Kind -> estimated number of entries in the directory.
+    _disk_entries: Dict[str, int]
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        directory: Optional[str] = None,
+        disk_max_entries: int = DISK_MAX_ENTRIES,
+    ):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.disk_max_entries = disk_max_entries
+        self._memory = OrderedDict()
+        self._disk_entries = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        return {
+            "max_entries": self.max_entries,
+            "directory": self.directory,
+            "disk_max_entries": self.disk_max_entries,
+        }
+
+    def __setstate__(self, state):
+        self.max_entries = state["max_entries"]
+        self.directory = state["directory"]
+        self.disk_max_entries = state["disk_max_entries"]
+        self._memory = OrderedDict()
+        self._disk_entries = {}
+
+    def controller_ast(
+        self, path: str, prefetched: Optional[SourceFile] = None
+    ) -> ast.AST:
+        return pickle.loads(
+            self._get(
+                "ast",
+                path,
+                _parse_controller_pickled,
+                _parse_controller_content_pickled,
+                True,
+                prefetched,
+            )
+        )
+
+    def glade_tree(
+        self, path: str, shared: bool = False, prefetched: Optional[SourceFile] = None
+    ) -> ElementTree.ElementTree:
+        """If shared, the cached tree itself is returned. It must not be modified then."""
+        tree = self._get(
+            "glade", path, parse_glade, parse_glade_source, False, prefetched
+        )
+        if shared:
+            return tree
+        return copy.deepcopy(tree)
+
+    def _get(
+        self,
+        kind: str,
+        path: str,
+        load: Callable[[str], Any],
+        load_content: Callable[[bytes], Any],
+        on_disk: bool,
+        prefetched: Optional[SourceFile] = None,
+    ) -> Any:
+        key = (kind, path)
+        stamp = prefetched.stamp if prefetched is not None else _stamp(path)
+        if key in self._memory:
+            cached_stamp, value = self._memory[key]
+            if cached_stamp == stamp:
+                self._memory.move_to_end(key)
+                return value
+
+        value = None
+        if on_disk and self.directory is not None:
+            value = self._read_disk(kind, path, stamp)
+        if value is None:
+            value = (
+                load(path) if prefetched is None else load_content(prefetched.content)
+            )
+            if on_disk and self.directory is not None:
+                self._write_disk(kind, path, stamp, value)
+
+        self._remember(key, stamp, value)
+        return value
+
+    def formatted_source(
+        self, source: str, format_source: Callable[[str], str], formatter: str
+    ) -> str:
+        """
+        Returns format_source(source), cached by the content hash of source and the
+        formatter (name and version of what format_source uses).
+        """
+        return self._get_by_hash(
+            "formatted",
+            content_hash(f"{formatter}\0{source}".encode("utf-8")),
+            lambda: format_source(source),
+        )
+
+    def verification(
+        self, outputs_hash: str, verify: Callable[[], List[str]]
+    ) -> List[str]:
+        """Returns the problems verify() finds, cached by the hash of the verified outputs."""
+        return list(self._get_by_hash("verified", outputs_hash, verify))
+
+    def _get_by_hash(self, kind: str, source_hash: str, load: Callable[[], Any]) -> Any:
+        key = (kind, source_hash)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key][1]
+
+        value = None
+        disk_path = None
+        if self.directory is not None:
+            disk_path = os.path.join(self.directory, f"{source_hash}.{kind}.pickle")
+            try:
+                with open(disk_path, "rb") as f:
+                    value = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+                value = None
+            else:
+                _touch(disk_path)
+        if value is None:
+            value = load()
+            if disk_path is not None:
+                self._write_disk_file(kind, disk_path, value)
+        self._remember(key, (0, 0), value)
+        return value
+
+    def _remember(self, key: Tuple[str, str], stamp: Stamp, value: Any):
+        self._memory[key] = (stamp, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, kind: str, path: str) -> str:
+        name = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(str(self.directory), f"{name}.{kind}.pickle")
+
+    def _read_disk(self, kind: str, path: str, stamp: Stamp) -> Optional[bytes]:
+        disk_path = self._disk_path(kind, path)
+        try:
+            with open(disk_path, "rb") as f:
+                cached_stamp, value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        if cached_stamp != stamp:
+            return None
+        _touch(disk_path)
+        return value
+
+    def _write_disk(self, kind: str, path: str, stamp: Stamp, value: bytes):
+        self._write_disk_file(kind, self._disk_path(kind, path), (stamp, value))
+
+    def _write_disk_file(self, kind: str, disk_path: str, value: Any):
+        if kind not in self._disk_entries:
+            self._disk_entries[kind] = len(self._scan_disk(kind))
+        if not os.path.exists(disk_path):
+            self._disk_entries[kind] += 1
+        tmp_path = f"{disk_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Atomic, so concurrent workers never see half written entries.
+        os.replace(tmp_path, disk_path)
+        if self._disk_entries[kind] > self.disk_max_entries:
+            self._evict_disk(kind)
+
+    def _scan_disk(self, kind: str) -> List[os.DirEntry]:
+        suffix = f".{kind}.pickle"
+        return [x for x in os.scandir(str(self.directory)) if x.name.endswith(suffix)]
+
+    def _evict_disk(self, kind: str):
+        """Deletes the least recently used entries of kind, down to DISK_EVICT_TO."""
+        keep = max(1, int(self.disk_max_entries * DISK_EVICT_TO))
+        entries = self._scan_disk(kind)
+        used: List[Tuple[int, str]] = []
+        for entry in entries:
+            try:
+                used.append((entry.stat().st_mtime_ns, entry.path))
+            except FileNotFoundError:
+                pass  # evicted by another process.
+        used.sort()
+        for _, path in used[: max(0, len(used) - keep)]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self._disk_entries[kind] = min(len(used), keep)
+
+
+def _touch(disk_path: str):
+    """Marks a cache file as recently used, unless another process evicted it."""
+    try:
+        os.utime(disk_path)
+    except FileNotFoundError:
+        pass
+
+
+def _stamp(path: str) -> Stamp:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _parse_controller_pickled(path: str) -> bytes:
+    return pickle.dumps(parse_controller(path), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _parse_controller_content_pickled(content: bytes) -> bytes:
+    return pickle.dumps(
+        parse_controller_source(decode_source(content)),
+        protocol=pickle.HIGHEST_PROTOCOL,
+    )
@@ -2,12 +2,18 @@ import dataclasses
 import json
 import os
 from dataclasses import dataclass
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, TextIO, Any
 
 from skytemple_view_migration.model import ControllerAndGlade
+from skytemple_view_migration.output import p_warn, p_info
+from skytemple_view_migration.util import file_hash
 
+# Number of journal records, on top of twice the number of entries, after which saving
+# an entry compacts the journal into the JSON file.
+JOURNAL_COMPACT_MIN = 1000
 
-@dataclass
+
+@dataclass(slots=True)
 class CollectInfoEntry:
     module_name: str
     controller_name: str
@@ -20,31 +26,79 @@ class CollectInfoEntry:
     item_data_type: Optional[str] = None
     new_widget_name: Optional[str] = None
     extra_init_params: List[str] = dataclasses.field(default_factory=list)
+    # Content hashes of the inputs at the time of the last analysis and of the last generated outputs.
+    controller_hash: Optional[str] = None
+    glade_hash: Optional[str] = None
+    widget_hash: Optional[str] = None
+    ui_hash: Optional[str] = None
+    # Hash of the generation settings and entry fields (see phase_two.entry_settings)
+    # of the last outputs.
+    settings_hash: Optional[str] = None
+    # Field name -> where the value was inferred from, for fields that were not found directly.
+    inferred: Dict[str, str] = dataclasses.field(default_factory=dict)
+
+    def merge(self, **values: Any):
+        """
+        Sets all given fields, except fields that already have a value to None or
+        to an empty list: Analysis results never erase what is already known.
+        """
+        for key, value in values.items():
+            current = getattr(self, key)
+            if value is None and current is not None:
+                continue
+            if isinstance(value, list) and len(value) < 1 and current:
+                continue
+            setattr(self, key, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The JSON representation. Lists and dicts are shared with the entry."""
+        return {key: getattr(self, key) for key in ENTRY_FIELDS}
+
+    def inputs_unchanged(self) -> bool:
+        return (
+            self.controller_hash is not None
+            and self.controller_hash == file_hash(self.controller_path)
+            and self.glade_hash == file_hash(self.glade_path)
+        )
+
+    def forget_inferred(self, key: str):
+        """Forget a previously inferred value, it could no longer be inferred."""
+        setattr(self, key, None)
+        del self.inferred[key]
+
+    def invalidate_outputs(self):
+        """Forget the hashes of the generated outputs, they no longer match the inputs."""
+        self.widget_hash = None
+        self.ui_hash = None
+        self.settings_hash = None
 
-    def __setattr__(self, key, value):
-        """Discard setting to None or empty list, if value is not None or empty list."""
-        try:
-            selfv = getattr(self, key)
-        except AttributeError:
-            return super().__setattr__(key, value)
-        if value is None and selfv is not None:
-            return
-        if (
-            isinstance(value, list)
-            and len(value) < 1
-            and isinstance(selfv, list)
-            and len(selfv) > 0
-        ):
-            return
-        return super().__setattr__(key, value)
+
+ENTRY_FIELDS = tuple(f.name for f in dataclasses.fields(CollectInfoEntry))
 
 
 class CollectInfo:
+    """
+    The collected info of all controllers, stored in a JSON file.
+
+    Changed entries are appended to a journal next to it (JSON_FILE.journal, one JSON
+    line per saved entry) as soon as they are saved, so nothing is lost if the process
+    is interrupted. Loading replays the journal over the JSON file. dump() compacts the
+    journal into the JSON file.
+    """
+
     json_file_path: str
+    journal_path: str
     entries: Dict[str, CollectInfoEntry]
+    journal: bool
+    _journal_file: Optional[TextIO]
+    _journal_records: int
 
-    def __init__(self, json_file_path: str):
+    def __init__(self, json_file_path: str, journal: bool = True):
         self.json_file_path = json_file_path
+        self.journal_path = f"{json_file_path}.journal"
+        self.journal = journal
+        self._journal_file = None
+        self._journal_records = 0
 
         if os.path.exists(self.json_file_path):
             with open(self.json_file_path, "r") as f:
@@ -53,25 +107,61 @@ class CollectInfo:
                 }
         else:
             self.entries = {}
+        self._replay_journal()
 
     def entry_for_controller(self, controller: ControllerAndGlade) -> CollectInfoEntry:
         p = controller.controller_path
         if p not in self.entries:
             self.entries[p] = CollectInfoEntry(
-                controller.module_name,
-                controller.controller_name,
-                controller.controller_path,
-                controller.glade_path,
+                module_name=controller.module_name,
+                controller_name=controller.controller_name,
+                glade_path=controller.glade_path,
+                controller_path=controller.controller_path,
             )
         return self.entries[p]
 
-    def dump(self):
-        with open(self.json_file_path, "w") as f:
-            json.dump(self.entries, f, cls=EnhancedJSONEncoder, indent=2)
+    def save(self, entry: CollectInfoEntry):
+        """Appends the entry to the journal. Compacts the journal if it got a lot larger than needed."""
+        if not self.journal:
+            return
+        if self._journal_file is None:
+            self._journal_file = open(self.journal_path, "a")
+        self._journal_file.write(
+            json.dumps([entry.controller_path, entry.to_dict()]) + "\n"
+        )
+        self._journal_file.flush()
+        self._journal_records += 1
+        if self._journal_records > JOURNAL_COMPACT_MIN + 2 * len(self.entries):
+            self.dump()
 
+    def dump(self):
+        """Writes all entries to the JSON file and clears the journal."""
+        tmp_path = f"{self.json_file_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({k: v.to_dict() for k, v in self.entries.items()}, f, indent=2)
+        os.replace(tmp_path, self.json_file_path)
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+        # Replaying the journal again would be harmless, if this is not reached.
+        if os.path.exists(self.journal_path):
+            os.unlink(self.journal_path)
+        self._journal_records = 0
 
-class EnhancedJSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if dataclasses.is_dataclass(o):
-            return dataclasses.asdict(o)
-        return super().default(o)
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r") as f:
+            for line in f:
+                try:
+                    path, values = json.loads(line)
+                except ValueError:
+                    # The last line may be incomplete, if writing it was interrupted.
+                    p_warn(f"Ignoring incomplete line in {self.journal_path}.")
+                    continue
+                self.entries[path] = CollectInfoEntry(**values)
+                self._journal_records += 1
+        if self._journal_records > 0:
+            p_info(
+                f"Recovered {self._journal_records} unsaved changes from {self.journal_path}."
+            )
@@ -1,30 +1,81 @@
-import os.path
-from glob import glob
-from typing import Iterable
+import os
+from typing import Iterable, Optional, Collection, Mapping, Tuple, Union, Set, Dict
 
 from skytemple_view_migration.model import ControllerAndGlade
 from skytemple_view_migration.output import p_debug, p_warn
 
+# (module name, controller name) -> glade file name (without extension),
+# for controllers whose glade file is not named like the controller.
+GLADE_OVERRIDES: Dict[Tuple[str, str], str] = {("rom", "main"): "rom"}
 
-def iter_controllers(skytemple_directory: str) -> Iterable[ControllerAndGlade]:
-    gl = os.path.join(
-        os.path.abspath(skytemple_directory), "skytemple/module/*/controller/*.py"
-    )
-    p_debug(f"Glob Pattern: {gl}")
-    for file in glob(gl):
-        parts = file.split("/")
-        controller_name = parts[-1][:-3]
+
+def iter_controllers(
+    skytemple_directories: Union[str, Iterable[str]],
+    modules: Optional[Collection[str]] = None,
+    glade_overrides: Mapping[Tuple[str, str], str] = GLADE_OVERRIDES,
+) -> Iterable[ControllerAndGlade]:
+    """
+    Finds all controllers with glade files in skytemple/module/*/controller of one or
+    more SkyTemple directories, optionally only in the given modules. Every controller
+    directory is listed once, no other file system access is needed.
+    """
+    if isinstance(skytemple_directories, str):
+        skytemple_directories = [skytemple_directories]
+    for skytemple_directory in skytemple_directories:
+        modules_dir = os.path.join(
+            os.path.abspath(skytemple_directory), "skytemple", "module"
+        )
+        p_debug(f"Scanning: {modules_dir}")
+        for module_name in _list_dirs(modules_dir):
+            if modules is not None and module_name not in modules:
+                continue
+            yield from _iter_module(
+                os.path.join(modules_dir, module_name, "controller"),
+                module_name,
+                glade_overrides,
+            )
+
+
+def _iter_module(
+    controller_dir: str,
+    module_name: str,
+    glade_overrides: Mapping[Tuple[str, str], str],
+) -> Iterable[ControllerAndGlade]:
+    controllers: Set[str] = set()
+    glades: Set[str] = set()
+    try:
+        with os.scandir(controller_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".py") and entry.is_file():
+                    controllers.add(entry.name[:-3])
+                elif entry.name.endswith(".glade") and entry.is_file():
+                    glades.add(entry.name[:-6])
+    except (FileNotFoundError, NotADirectoryError):
+        return
+
+    for controller_name in sorted(controllers):
         if controller_name == "__init__":
             continue
-        module_name = parts[-3]
         p_debug(f"Collecting controller {controller_name} in {module_name}.")
-        glade_path = file[:-3] + ".glade"
-        # hack for the rom/main.py -> rom/rom.glade situation.
-        if module_name == "rom" and controller_name == "main":
-            glade_path = "/".join(glade_path.split("/")[:-1] + ["rom.glade"])
-        if not os.path.exists(glade_path):
+        glade_name = glade_overrides.get(
+            (module_name, controller_name), controller_name
+        )
+        if glade_name not in glades:
             p_warn(
                 f"No glade file found for {module_name}/{controller_name}. Skipping."
             )
             continue
-        yield ControllerAndGlade(module_name, controller_name, file, glade_path)
+        yield ControllerAndGlade(
+            module_name,
+            controller_name,
+            os.path.join(controller_dir, f"{controller_name}.py"),
+            os.path.join(controller_dir, f"{glade_name}.glade"),
+        )
+
+
+def _list_dirs(path: str) -> Iterable[str]:
+    try:
+        with os.scandir(path) as it:
+            return sorted(x.name for x in it if x.is_dir())
+    except FileNotFoundError:
+        return []
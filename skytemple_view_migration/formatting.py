@@ -0,0 +1,38 @@
+from typing import Optional
+
+from skytemple_view_migration.cache import ParseCache
+from skytemple_view_migration.output import p_warn
+from skytemple_view_migration.util import assert_not_none
+
+try:
+    import black
+except ImportError:
+    black = None  # type: ignore
+
+
+def formatter_available() -> bool:
+    return black is not None
+
+
+def formatter_version() -> Optional[str]:
+    """Version and mode of black. Formatted output may differ if they change."""
+    if black is None:
+        return None
+    return f"black {black.__version__} {black.Mode()!r}"
+
+
+def format_source(source: str) -> str:
+    """Formats Python source with black. Returns it unchanged if it can not be formatted."""
+    try:
+        return black.format_str(source, mode=black.Mode())
+    except black.InvalidInput as e:
+        p_warn(f"Could not format the widget: {e}")
+        return source
+
+
+def format_widget_source(source: str, cache: Optional[ParseCache] = None) -> str:
+    if cache is not None:
+        return cache.formatted_source(
+            source, format_source, assert_not_none(formatter_version())
+        )
+    return format_source(source)
@@ -0,0 +1,246 @@
+import ast
+import os
+from typing import Optional, Dict, List, Tuple, Mapping, Callable
+
+from skytemple_view_migration.cache import (
+    ParseCache,
+    parse_controller,
+    parse_controller_source,
+)
+from skytemple_view_migration.model import ControllerAndGlade
+from skytemple_view_migration.output import p_debug
+from skytemple_view_migration.ui_xml import (
+    scan_glade_top_level,
+    BuilderObject,
+    GladeSource,
+)
+from skytemple_view_migration.util import camel_case
+
+# Field name -> (value, where the value was inferred from)
+Inferred = Dict[str, Tuple[str, str]]
+# Parsed files of a module package: (name, AST)
+ModuleFiles = List[Tuple[str, ast.AST]]
+
+# Top-level glade objects with a class ending in one of these are never the main widget:
+# Models, adjustments etc. and windows, dialogs and menus that are shown on their own.
+NOT_MAIN_WIDGET_SUFFIXES = (
+    "Adjustment",
+    "Store",
+    "Buffer",
+    "TagTable",
+    "Completion",
+    "SizeGroup",
+    "Filter",
+    "Sort",
+    "AccelGroup",
+    "Renderer",
+    "Window",
+    "Dialog",
+    "Popover",
+    "Menu",
+)
+MODULE_BASE_CLASS = "AbstractModule"
+# Files of a module package that are searched for the module class and controller usages.
+MODULE_FILES = ("__init__.py", "module.py")
+
+
+def infer_fields(
+    module_name: str,
+    controller_name: str,
+    glade: GladeSource,
+    module_files: Callable[[], ModuleFiles],
+    controller_class_name: Optional[str],
+    values: Mapping[str, Optional[str]],
+) -> Inferred:
+    """
+    Tries to infer the fields of values that are None from the glade file and the
+    files of the module package of the controller, which are only loaded if needed.
+    Only returns values that could be inferred.
+    """
+    inferred: Inferred = {}
+    if values["new_widget_name"] is None:
+        module_name_cc = camel_case(module_name)
+        controller_name_cc = camel_case(controller_name)
+        inferred["new_widget_name"] = (
+            f"St{module_name_cc[0].upper()}{module_name_cc[1:]}"
+            f"{controller_name_cc[0].upper()}{controller_name_cc[1:]}Page",
+            "controller file name",
+        )
+    if values["main_widget_name"] is None:
+        inferred.update(infer_main_widget(glade))
+    if values["module_class"] is None or (
+        values["item_data_type"] is None and controller_class_name is not None
+    ):
+        modules = module_files()
+        if values["module_class"] is None:
+            inferred.update(infer_module_class(modules))
+        if values["item_data_type"] is None and controller_class_name is not None:
+            inferred.update(infer_item_data_type(modules, controller_class_name))
+    return inferred
+
+
+def infer_main_widget(glade: GladeSource) -> Inferred:
+    """The main widget is the only top-level object of the glade file that can be one."""
+    candidates = [
+        (id_name, gtk_class)
+        for id_name, gtk_class in scan_glade_top_level(glade)
+        if not gtk_class.endswith(NOT_MAIN_WIDGET_SUFFIXES)
+    ]
+    if len(candidates) != 1:
+        p_debug(f"Main widget candidates: {candidates}")
+        return {}
+    id_name, gtk_class = candidates[0]
+    source = "glade: only top-level widget"
+    inferred = {"main_widget_name": (id_name, source)}
+    try:
+        inferred["main_widget_type"] = (
+            BuilderObject(id_name, gtk_class).py_class,
+            source,
+        )
+    except KeyError:
+        pass
+    return inferred
+
+
+def infer_module_class(modules: ModuleFiles) -> Inferred:
+    """The module class is the only subclass of AbstractModule in the module package."""
+    found = [
+        (node.name, f"{path}:{node.lineno}")
+        for path, tree in modules
+        for node in ast.walk(tree)
+        if isinstance(node, ast.ClassDef)
+        and any(_base_name(base) == MODULE_BASE_CLASS for base in node.bases)
+    ]
+    if len(found) != 1:
+        return {}
+    return {"module_class": found[0]}
+
+
+def infer_item_data_type(modules: ModuleFiles, controller_class_name: str) -> Inferred:
+    """
+    The item data type is the type of what the module package passes as item data
+    to the controller, either by constructing it or in a tree row, if it is always
+    the same.
+    """
+    usages = []
+    for path, tree in modules:
+        v = ItemDataVisitor(controller_class_name)
+        v.visit(tree)
+        usages += [(typ, f"{path}:{lineno}") for typ, lineno in v.usages]
+    types = {typ for typ, _ in usages}
+    if len(types) != 1 or None in types:
+        p_debug(f"Item data usages of {controller_class_name}: {usages}")
+        return {}
+    typ, source = usages[0]
+    assert typ is not None
+    return {"item_data_type": (typ, source)}
+
+
+class ItemDataVisitor(ast.NodeVisitor):
+    """
+    Collects the types of item data passed to a controller class, either in calls
+    (ControllerClass(module, item_data)) or in tree rows ([..., ControllerClass, item_data, ...]).
+    The type is None if it can not be determined.
+    """
+
+    controller_class_name: str
+    usages: List[Tuple[Optional[str], int]]
+    _annotations: List[Dict[str, str]]
+
+    def __init__(self, controller_class_name: str):
+        self.controller_class_name = controller_class_name
+        self.usages = []
+        self._annotations = []
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        self._annotations.append(
+            {
+                arg.arg: _annotation(arg.annotation)
+                for arg in node.args.args + node.args.kwonlyargs
+                if arg.annotation is not None
+            }
+        )
+        self.generic_visit(node)
+        self._annotations.pop()
+
+    def visit_Call(self, node: ast.Call):
+        if _base_name(node.func) == self.controller_class_name and len(node.args) > 1:
+            self.usages.append((self._type_of(node.args[1]), node.lineno))
+        self.generic_visit(node)
+
+    def visit_List(self, node: ast.List):
+        self._visit_row(node.elts)
+        self.generic_visit(node)
+
+    def visit_Tuple(self, node: ast.Tuple):
+        self._visit_row(node.elts)
+        self.generic_visit(node)
+
+    def _visit_row(self, elts: List[ast.expr]):
+        for i, elt in enumerate(elts[:-1]):
+            if _base_name(elt) == self.controller_class_name:
+                self.usages.append((self._type_of(elts[i + 1]), elt.lineno))
+
+    def _type_of(self, node: ast.expr) -> Optional[str]:
+        match node:
+            case ast.Constant(value=None):
+                return "None"
+            case ast.Constant(value=value):
+                return type(value).__name__
+            case ast.Name(id=name) if len(self._annotations) > 0:
+                return self._annotations[-1].get(name, None)
+            case ast.Call(func=ast.Name(id=("int" | "str" | "bool" | "float") as name)):
+                return name
+        return None
+
+
+def load_module_files(
+    controller: ControllerAndGlade, cache: Optional[ParseCache] = None
+) -> ModuleFiles:
+    """Parses the files of the module package of the controller, that exist."""
+    module_dir = os.path.dirname(os.path.dirname(controller.controller_path))
+    modules = []
+    for file_name in MODULE_FILES:
+        path = os.path.join(module_dir, file_name)
+        if not os.path.isfile(path):
+            continue
+        try:
+            tree = (
+                cache.controller_ast(path)
+                if cache is not None
+                else parse_controller(path)
+            )
+        except SyntaxError as e:
+            p_debug(f"Could not parse {path}: {e}")
+            continue
+        modules.append((f"{controller.module_name}/{file_name}", tree))
+    return modules
+
+
+def parse_module_sources(module_name: str, sources: Mapping[str, str]) -> ModuleFiles:
+    """Parses the given files (name -> source) of a module package."""
+    modules = []
+    for file_name, source in sources.items():
+        try:
+            modules.append(
+                (f"{module_name}/{file_name}", parse_controller_source(source))
+            )
+        except SyntaxError as e:
+            p_debug(f"Could not parse {file_name}: {e}")
+    return modules
+
+
+def _base_name(node: ast.expr) -> Optional[str]:
+    match node:
+        case ast.Name(id=name):
+            return name
+        case ast.Attribute(attr=name):
+            return name
+    return None
+
+
+def _annotation(node: ast.expr) -> str:
+    match node:
+        case ast.Constant(value=str(name)):
+            return name
+    return ast.unparse(node)
@@ -1,8 +1,17 @@
 import ast
 from dataclasses import dataclass
-from xml.etree import ElementTree
+from typing import Optional
+from xml.etree.ElementTree import ElementTree
 
-import ast_comments
+from skytemple_view_migration.cache import (
+    ParseCache,
+    SourceFile,
+    decode_source,
+    parse_controller,
+    parse_controller_source,
+    parse_glade,
+    parse_glade_source,
+)
 
 
 @dataclass
@@ -12,12 +21,27 @@ class ControllerAndGlade:
     controller_path: str
     glade_path: str
 
-    def load_controller_ast(self) -> ast.AST:
-        with open(self.controller_path, "r") as f:
-            return ast_comments.parse(f.read())
+    def load_controller_ast(
+        self,
+        cache: Optional[ParseCache] = None,
+        prefetched: Optional[SourceFile] = None,
+    ) -> ast.AST:
+        """prefetched is the content of the controller, if it was already read."""
+        if cache is not None:
+            return cache.controller_ast(self.controller_path, prefetched)
+        if prefetched is not None:
+            return parse_controller_source(decode_source(prefetched.content))
+        return parse_controller(self.controller_path)
 
-    def load_glade_tree(self):
-        parser = ElementTree.XMLParser(
-            target=ElementTree.TreeBuilder(insert_comments=True)
-        )
-        return ElementTree.parse(self.glade_path, parser=parser)
+    def load_glade_tree(
+        self,
+        cache: Optional[ParseCache] = None,
+        shared: bool = False,
+        prefetched: Optional[SourceFile] = None,
+    ) -> ElementTree:
+        """If shared, the tree may be shared with the cache and must not be modified."""
+        if cache is not None:
+            return cache.glade_tree(self.glade_path, shared, prefetched)
+        if prefetched is not None:
+            return parse_glade_source(prefetched.content)
+        return parse_glade(self.glade_path)
@@ -1,8 +1,13 @@
-from typing import Callable, Optional
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional, List, Iterator
 
 import click
 from click import echo
 
+# Warnings collected by capture_warnings(), per thread.
+_captured = threading.local()
+
 
 def p_info(text: str):
     echo("[i] " + text)
@@ -13,9 +18,33 @@ def p_debug(text: str):
 
 
 def p_warn(text: str):
+    warnings: Optional[List[str]] = getattr(_captured, "warnings", None)
+    if warnings is not None:
+        warnings.append(text)
+        return
     echo(click.style(fg="yellow", text="[!] " + text))
 
 
+@contextmanager
+def capture_warnings() -> Iterator[List[str]]:
+    """
+    Collect warnings instead of printing them, so they can be replayed in order later.
+    Only affects the current thread.
+    """
+    previous = getattr(_captured, "warnings", None)
+    warnings: List[str] = []
+    _captured.warnings = warnings
+    try:
+        yield warnings
+    finally:
+        _captured.warnings = previous
+
+
+def p_warns(texts: List[str]):
+    for text in texts:
+        p_warn(text)
+
+
 def prompt(prompt_text: str, question_callback: Optional[Callable[[], str]]) -> str:
     o_prompt_text = prompt_text
     if question_callback is not None:
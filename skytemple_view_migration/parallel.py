@@ -0,0 +1,151 @@
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Sequence,
+    TypeVar,
+)
+
+from skytemple_view_migration import profiling
+
+T = TypeVar("T")
+U = TypeVar("U")
+R = TypeVar("R")
+
+# Items that are read ahead of the transforms, and results waiting to be written, at most.
+PIPELINE_WINDOW = 16
+# Threads reading files ahead. Reading mostly waits for the disk, not the GIL.
+IO_THREADS = 4
+
+
+def map_jobs(fn: Callable[[T], R], items: Iterable[T], jobs: int) -> Iterator[R]:
+    """
+    Maps fn over items, in a process pool if jobs > 1. Results are always yielded in
+    the order of items. With jobs <= 1 this is a lazy, plain map in this process.
+    """
+    if jobs <= 1:
+        yield from map(fn, items)
+        return
+    items = list(items)
+    chunksize = max(1, len(items) // (jobs * 4))
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=profiling.init_worker,
+        initargs=(profiling.enabled(),),
+    ) as executor:
+        yield from executor.map(fn, items, chunksize=chunksize)
+
+
+def map_pipelined(
+    read: Callable[[T], U],
+    fn: Callable[[U], R],
+    items: Sequence[T],
+    jobs: int,
+    window: int = PIPELINE_WINDOW,
+) -> Iterator[R]:
+    """
+    Maps fn over read(item) for all items, like map_jobs. read (blocking I/O) runs in
+    a thread pool, at most window items ahead of fn, so reading the next items
+    overlaps with fn even with jobs <= 1. With jobs > 1 at most jobs * 2 chunks are
+    sent to the process pool at once. Results are yielded in the order of items.
+    """
+    with ThreadPoolExecutor(max_workers=IO_THREADS) as io:
+        inputs = prefetch(io, read, items, window)
+        if jobs <= 1:
+            yield from map(fn, inputs)
+            return
+        chunksize = max(1, len(items) // (jobs * 4))
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=profiling.init_worker,
+            initargs=(profiling.enabled(),),
+        ) as executor:
+            for results in prefetch(
+                executor, partial(_map_chunk, fn), _chunks(inputs, chunksize), jobs * 2
+            ):
+                yield from results
+
+
+def prefetch(
+    executor: Executor, fn: Callable[[T], R], items: Iterable[T], window: int
+) -> Iterator[R]:
+    """
+    Maps fn over items in executor, in order. Only window calls are submitted ahead
+    of the result that is consumed, so results do not pile up if that is slower.
+    """
+    pending: Deque[Future[R]] = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while len(pending) > 0:
+        yield pending.popleft().result()
+
+
+class BackgroundQueue(Generic[R]):
+    """
+    Runs calls one after the other in a background thread, in the order they were put.
+    put() blocks while window calls are pending. The results are passed to done in the
+    thread that puts, in order, errors are raised there. Once a call failed, the calls
+    after it are skipped. Leaving the with block waits for all calls.
+    """
+
+    _executor: ThreadPoolExecutor
+    _pending: Deque[Future[R]]
+    _done: Callable[[R], Any]
+    _window: int
+    _failed: bool
+
+    def __init__(self, done: Callable[[R], Any], window: int = PIPELINE_WINDOW):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = deque()
+        self._done = done
+        self._window = window
+        self._failed = False
+
+    def __enter__(self) -> "BackgroundQueue[R]":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # On errors here, what was put until then is still finished, but not reported.
+        self._executor.shutdown(wait=True)
+        if exc_type is None:
+            while len(self._pending) > 0:
+                self._done(self._pending.popleft().result())
+
+    def put(self, fn: Callable[..., R], *args: Any):
+        self._pending.append(self._executor.submit(self._call, fn, *args))
+        while len(self._pending) > 0 and (
+            len(self._pending) > self._window or self._pending[0].done()
+        ):
+            self._done(self._pending.popleft().result())
+
+    def _call(self, fn: Callable[..., R], *args: Any) -> R:
+        if self._failed:
+            raise RuntimeError("Skipped after a previous call failed.")
+        try:
+            return fn(*args)
+        except BaseException:
+            self._failed = True
+            raise
+
+
+def _chunks(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if len(chunk) < 1:
+            return
+        yield chunk
+
+
+def _map_chunk(fn: Callable[[T], R], items: List[T]) -> List[R]:
+    return [fn(x) for x in items]
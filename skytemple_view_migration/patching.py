@@ -0,0 +1,251 @@
+import ast
+import re
+from bisect import bisect_left
+from typing import List, Tuple, Union, Sequence, Set
+
+# Comments that may be misplaced on changed lines and are removed from them.
+TYPE_IGNORE = re.compile(rb"[ \t]*# type: ignore(\[[^\]]*\])?")
+# Between statements on the same line.
+SEPARATOR = re.compile(rb"[ \t]*;[ \t]*")
+SEPARATOR_BEFORE = re.compile(rb"[ \t]*;[ \t]*\Z")
+
+# A span of the original source. As replacement, it is copied with its own edits applied.
+Span = Tuple[int, int]
+# (start, end, attached, order recorded, replacement)
+Edit = Tuple[int, int, bool, int, Union[bytes, Span]]
+
+
+class SourcePatch:
+    """
+    Edits of a Python source, recorded against the positions of the nodes of its AST
+    (which may be modified in the meantime, the positions of the original nodes stay
+    valid) and applied in one pass. Everything that is not edited is kept as it is.
+
+    Where edits start at the same position, insertions come first, in the order they
+    were recorded, but lines attached to the statement after them (decorators) last.
+    Edits inside a span that is replaced are dropped, unless the span is moved
+    somewhere else, then they are applied there.
+    """
+
+    source: bytes
+    _line_starts: List[int]
+    _edits: List[Edit]
+    # Spans of deleted statements that share their line with others.
+    _inline_deletions: List[Span]
+
+    def __init__(self, source: str):
+        # AST column offsets are in UTF-8 bytes, so we work on those.
+        self.source = source.encode("utf-8")
+        self._line_starts = [0] + [m.end() for m in re.finditer(b"\n", self.source)]
+        self._edits = []
+        self._inline_deletions = []
+
+    def segment(self, node: ast.AST) -> str:
+        start, end = self._span(node)
+        return self.source[start:end].decode("utf-8")
+
+    def replace(self, node: ast.AST, text: str):
+        start, end = self._span(node)
+        self._edit(start, end, text.encode("utf-8"))
+
+    def insert(self, lineno: int, col_offset: int, text: str):
+        offset = self._offset(lineno, col_offset)
+        self._edit(offset, offset, text.encode("utf-8"))
+
+    def insert_before(
+        self,
+        node: ast.stmt,
+        *lines: str,
+        decorators: bool = True,
+        attached: bool = False,
+    ):
+        """
+        Inserts lines before a statement (and its decorators, if decorators is set),
+        indented like it. If attached, they come after all other lines inserted there.
+        """
+        lineno = node.lineno
+        if decorators and hasattr(node, "decorator_list"):
+            lineno = min([lineno] + [x.lineno for x in node.decorator_list])
+        offset = self._line_starts[lineno - 1]
+        self._edit(offset, offset, self._lines(lineno, lines), attached)
+
+    def insert_after(self, node: ast.stmt, *lines: str):
+        """Inserts lines after a statement, indented like it."""
+        offset = self._line_end(_end_lineno(node))
+        text = self._lines(node.lineno, lines)
+        if offset == len(self.source) and not self.source.endswith(b"\n"):
+            text = b"\n" + text
+        self._edit(offset, offset, text)
+
+    def move_after(self, node: ast.stmt, statements: Sequence[ast.stmt]):
+        """
+        Inserts the lines of the statements (with their edits) after node. The
+        statements must be deleted where they are, usually with what contains them.
+        """
+        offset = self._line_end(_end_lineno(node))
+        span = (
+            self._line_starts[statements[0].lineno - 1],
+            self._line_end(_end_lineno(statements[-1])),
+        )
+        self._edit(offset, offset, span)
+
+    def delete(self, node: ast.stmt, blank_lines_before: bool = False):
+        """
+        Deletes a statement. If it is on lines of its own, they are deleted completely,
+        including the blank lines before it, if blank_lines_before is set.
+        """
+        lineno = node.lineno
+        if hasattr(node, "decorator_list"):
+            lineno = min([lineno] + [x.lineno for x in node.decorator_list])
+        start, end = self._span(node)
+        line_start = self._line_starts[lineno - 1]
+        line_end = self._line_end(_end_lineno(node))
+        before = self.source[line_start:start]
+        after = self.source[end:line_end].lstrip()
+        if before.strip() == b"" and (after == b"" or after.startswith(b"#")):
+            if blank_lines_before:
+                while lineno > 1 and self._is_blank(lineno - 1):
+                    lineno -= 1
+            self._edit(self._line_starts[lineno - 1], line_end, b"")
+        else:
+            # Other statements on the same line, the separators are deleted in apply.
+            self._inline_deletions.append((start, end))
+
+    def apply(self) -> str:
+        """
+        Returns the source with all edits applied. "type: ignore" comments are removed
+        from all lines that were changed.
+        """
+        self._delete_inline()
+        self._edits.sort()
+        out = bytearray()
+        changed: List[Tuple[int, int]] = []
+        self._render(0, len(self.source), out, changed, True)
+
+        newlines = [m.start() for m in re.finditer(b"\n", out)]
+        changed_lines: Set[int] = set()
+        for start, end in changed:
+            changed_lines.update(
+                range(bisect_left(newlines, start), bisect_left(newlines, end) + 1)
+            )
+        lines = bytes(out).split(b"\n")
+        for i in changed_lines:
+            if i < len(lines):
+                lines[i] = TYPE_IGNORE.sub(b"", lines[i])
+        return b"\n".join(lines).decode("utf-8")
+
+    def _render(
+        self,
+        start: int,
+        end: int,
+        out: bytearray,
+        changed: List[Tuple[int, int]],
+        whole: bool,
+    ):
+        """
+        Appends the span with the edits in it to out. changed gets the (inclusive)
+        ranges of out that are on changed lines.
+        """
+        pos = start
+        for edit_start, edit_end, _, _, replacement in self._edits:
+            # Insertions at the end of a moved span belong to what comes after it.
+            if edit_start < pos or edit_end > end or (edit_start == end and not whole):
+                continue
+            out += self.source[pos:edit_start]
+            out_start = len(out)
+            if isinstance(replacement, tuple):
+                self._render(replacement[0], replacement[1], out, changed, False)
+            elif len(replacement) > 0:
+                out += replacement
+                changed.append((out_start, len(out) - 1))
+            elif not self._at_line_start(edit_start) or not self._at_line_start(
+                edit_end
+            ):
+                changed.append((out_start, out_start))
+            pos = edit_end
+        out += self.source[pos:end]
+
+    def _delete_inline(self):
+        """
+        Records the deletions of statements that share their line with others. Runs of
+        deleted statements are deleted with the separator after them, or the one
+        before them, if they are the last on the line, so no separator is left over.
+        """
+        runs: List[List[int]] = []
+        for start, end in sorted(set(self._inline_deletions)):
+            if len(runs) > 0:
+                separator = SEPARATOR.match(self.source, runs[-1][1])
+                if separator is not None and separator.end() == start:
+                    runs[-1][1] = end
+                    continue
+            runs.append([start, end])
+        for start, end in runs:
+            following = SEPARATOR.match(self.source, end)
+            preceding = SEPARATOR_BEFORE.search(
+                self.source, self.source.rfind(b"\n", 0, start) + 1, start
+            )
+            if following is not None:
+                self._edit(start, following.end(), b"")
+            elif preceding is not None:
+                self._edit(preceding.start(), end, b"")
+            else:
+                self._edit(start, end, b"")
+        self._inline_deletions = []
+
+    def _edit(
+        self,
+        start: int,
+        end: int,
+        replacement: Union[bytes, Span],
+        attached: bool = False,
+    ):
+        self._edits.append((start, end, attached, len(self._edits), replacement))
+
+    def _span(self, node: ast.AST) -> Span:
+        lineno, col_offset, end_lineno, end_col_offset = _position(node)
+        start = self._offset(lineno, col_offset)
+        return start, self._offset(end_lineno, end_col_offset)
+
+    def _offset(self, lineno: int, col_offset: int) -> int:
+        return self._line_starts[lineno - 1] + col_offset
+
+    def _line_end(self, lineno: int) -> int:
+        """Offset of the start of the next line (or of the end of the source)."""
+        if lineno < len(self._line_starts):
+            return self._line_starts[lineno]
+        return len(self.source)
+
+    def _is_blank(self, lineno: int) -> bool:
+        return (
+            self.source[self._line_starts[lineno - 1] : self._line_end(lineno)].strip()
+            == b""
+        )
+
+    def _at_line_start(self, offset: int) -> bool:
+        return (
+            offset == 0 or offset == len(self.source) or self.source[offset - 1] == 10
+        )
+
+    def _lines(self, lineno: int, lines: Sequence[str]) -> bytes:
+        line = self.source[self._line_starts[lineno - 1] : self._line_end(lineno)]
+        indent = line[: len(line) - len(line.lstrip())].rstrip(b"\r\n")
+        return b"".join(
+            indent + x.encode("utf-8") + b"\n" if x != "" else b"\n" for x in lines
+        )
+
+
+def _end_lineno(node: ast.AST) -> int:
+    return _position(node)[2]
+
+
+def _position(node: ast.AST) -> Tuple[int, int, int, int]:
+    """(lineno, col_offset, end_lineno, end_col_offset) of a node of the original source."""
+    end_col_offset = getattr(node, "end_col_offset", None)
+    if end_col_offset is None:
+        raise ValueError(f"{type(node).__name__} node has no position.")
+    return (
+        getattr(node, "lineno"),
+        getattr(node, "col_offset"),
+        getattr(node, "end_lineno"),
+        end_col_offset,
+    )
@@ -1,104 +1,487 @@
 import ast
 from ast import ClassDef, Name, FunctionDef, Return, Assign
-from typing import Optional, Tuple, List, Dict
-from xml.etree.ElementTree import ElementTree
-
-from skytemple_view_migration.collect_info import CollectInfo
-from skytemple_view_migration.files import iter_controllers
+from dataclasses import dataclass, field
+from functools import partial
+from typing import (
+    Optional,
+    List,
+    Dict,
+    Iterable,
+    Collection,
+    Mapping,
+    Tuple,
+    Callable,
+)
+
+from skytemple_view_migration.cache import ParseCache
+from skytemple_view_migration.collect_info import CollectInfo, CollectInfoEntry
+from skytemple_view_migration.files import iter_controllers, GLADE_OVERRIDES
+from skytemple_view_migration.inference import (
+    Inferred,
+    infer_fields,
+    load_module_files,
+    ModuleFiles,
+)
 from skytemple_view_migration.model import ControllerAndGlade
-from skytemple_view_migration.output import p_info, p_warn, prompt, p_debug
-from skytemple_view_migration.ui_xml import find_object
-from skytemple_view_migration.util import assert_is, camel_case, parse_annotation
-
-
-def run_phase1(skytemple_directory: str, collect_info: CollectInfo):
+from skytemple_view_migration.output import (
+    p_info,
+    p_warn,
+    prompt,
+    p_debug,
+    capture_warnings,
+    p_warns,
+)
+from skytemple_view_migration import profiling
+from skytemple_view_migration.parallel import map_jobs
+from skytemple_view_migration.profiling import section, ProfileRecords
+from skytemple_view_migration.ui_xml import scan_glade_object, GladeSource
+from skytemple_view_migration.util import (
+    assert_is,
+    camel_case,
+    parse_annotation,
+    file_hash,
+)
+
+# Fields that have to be known about a controller before a widget can be generated.
+REQUIRED_FIELDS = (
+    "new_widget_name",
+    "module_class",
+    "main_widget_name",
+    "main_widget_type",
+    "item_data_type",
+)
+
+
+def run_phase1(
+    skytemple_directory: str,
+    collect_info: CollectInfo,
+    jobs: int = 1,
+    force: bool = False,
+    cache: Optional[ParseCache] = None,
+    modules: Optional[Collection[str]] = None,
+    glade_overrides: Mapping[Tuple[str, str], str] = GLADE_OVERRIDES,
+    interactive: bool = True,
+):
     p_info("Starting Phase 1.")
-    for controller in iter_controllers(skytemple_directory):
-        info = collect_info.entry_for_controller(controller)
-        p_info(f"Processing {controller.controller_name} in {controller.module_name}.")
+    unchanged = 0
+
+    def controllers_to_analyze() -> Iterable[ControllerAndGlade]:
+        nonlocal unchanged
+        for controller in iter_controllers(
+            skytemple_directory, modules, glade_overrides
+        ):
+            info = collect_info.entries.get(controller.controller_path)
+            if (
+                not force
+                and info is not None
+                and len(missing_fields(info)) < 1
+                and info.inputs_unchanged()
+            ):
+                p_debug(f"Skipping unchanged {controller.controller_name}.")
+                unchanged += 1
+                continue
+            yield controller
+
+    analyze_controllers(
+        collect_info, controllers_to_analyze(), jobs, cache, interactive
+    )
+
+    if unchanged > 0:
+        p_info(f"Skipped {unchanged} unchanged controllers.")
+
+
+def analyze_controllers(
+    collect_info: CollectInfo,
+    controllers: Iterable[ControllerAndGlade],
+    jobs: int = 1,
+    cache: Optional[ParseCache] = None,
+    interactive: bool = True,
+) -> List[CollectInfoEntry]:
+    """
+    Analyzes the controllers, merges the results into collect_info and prompts for
+    missing fields. If not interactive, controllers with missing fields are reported
+    and left incomplete instead.
+    """
+    infos = []
+    if not interactive:
+        for analysis in map_jobs(
+            partial(analyze_controller, cache=cache), controllers, jobs
+        ):
+            info = merge_analysis(collect_info, analysis)
+            if info is not None:
+                missing = missing_fields(info)
+                if len(missing) > 0:
+                    p_warn(
+                        f"Could not resolve {', '.join(missing)} of "
+                        f"{info.module_name}/{info.controller_name}. Leaving it incomplete."
+                    )
+                infos.append(info)
+        unresolved = sum(1 for x in infos if len(missing_fields(x)) > 0)
+        if unresolved > 0:
+            p_info(
+                f"{unresolved} controllers are incomplete and will not be migrated. "
+                f"Run without --non-interactive to complete them."
+            )
+    elif jobs <= 1:
+        for analysis in map_jobs(
+            partial(analyze_controller, cache=cache), controllers, jobs
+        ):
+            info = merge_analysis(collect_info, analysis)
+            if info is not None:
+                if len(missing_fields(info)) > 0:
+                    prompt_missing(collect_info, info, analysis)
+                infos.append(info)
+    else:
+        # Analyze everything in parallel first, then ask for missing fields afterwards.
+        analyses = list(
+            map_jobs(partial(analyze_controller, cache=cache), controllers, jobs)
+        )
+        merged = [(merge_analysis(collect_info, a), a) for a in analyses]
+        for info, analysis in merged:
+            if info is not None:
+                if len(missing_fields(info)) > 0:
+                    p_info(
+                        f"Completing {analysis.controller.controller_name} in {analysis.controller.module_name}."
+                    )
+                    prompt_missing(collect_info, info, analysis)
+                infos.append(info)
+    return infos
+
+
+@dataclass
+class ControllerAnalysis:
+    """Result of the non-interactive part of Phase 1 for a single controller."""
+
+    controller: ControllerAndGlade
+    warnings: List[str] = field(default_factory=list)
+    skipped: bool = False
+    controller_hash: Optional[str] = None
+    glade_hash: Optional[str] = None
+    controller_class_name: Optional[str] = None
+    new_widget_name: Optional[str] = None
+    module_class: Optional[str] = None
+    item_data_type: Optional[str] = None
+    extra_init_params: List[str] = field(default_factory=list)
+    main_widget_name: Optional[str] = None
+    main_widget_type: Optional[str] = None
+    func_init: Optional[FunctionDef] = None
+    func_get_view: Optional[FunctionDef] = None
+    inferred: Inferred = field(default_factory=dict)
+    profile: Optional[ProfileRecords] = None
+
+
+def analyze_controller(
+    controller: ControllerAndGlade, cache: Optional[ParseCache] = None
+) -> ControllerAnalysis:
+    """Collects everything that can be collected without asking. Safe to run in a worker process."""
+    analysis = ControllerAnalysis(controller)
+    with (
+        capture_warnings() as warnings,
+        profiling.capture() as profile,
+        section(f"{controller.module_name}/{controller.controller_name}"),
+    ):
+        with section("hash inputs"):
+            analysis.controller_hash = file_hash(controller.controller_path)
+            analysis.glade_hash = file_hash(controller.glade_path)
+        with section("parse controller"):
+            controller_ast = controller.load_controller_ast(cache)
+        analyze_controller_tree(
+            analysis,
+            controller_ast,
+            controller.glade_path,
+            partial(load_module_files, controller, cache),
+        )
+    analysis.warnings = warnings
+    analysis.profile = profile
+    return analysis
+
+
+def analyze_controller_tree(
+    analysis: ControllerAnalysis,
+    controller_ast: ast.AST,
+    glade: GladeSource,
+    module_files: Callable[[], ModuleFiles],
+):
+    """
+    Fills analysis from the parsed controller, the glade file and (for inference)
+    the files of the module package. The paths of analysis.controller are not used.
+    """
+    controller = analysis.controller
+    with section("analyze controller"):
+        cls = analyze_controller_ast(controller_ast, controller.module_name)
+    base_class = cls.base_class if cls is not None else None
+    if cls is None or base_class != "AbstractController":
+        p_warn(f"Skipping because of not direct base class {base_class}...")
+        analysis.skipped = True
+        return
+    analysis.controller_class_name = cls.node.name
+    analysis.new_widget_name = cls.new_widget_name
+    analysis.func_init = cls.func_init
+    analysis.module_class = cls.module_class
+    analysis.item_data_type = cls.item_data_type
+    analysis.extra_init_params = cls.extra_init_params
+    analysis.func_get_view = cls.func_get_view
+    analysis.main_widget_name = cls.main_widget_name
+    if cls.main_widget_name is not None:
+        with section("scan glade"):
+            analysis.main_widget_type = c_main_widget_type(glade, cls.main_widget_name)
+    with section("infer"):
+        analysis.inferred = infer_fields(
+            controller.module_name,
+            controller.controller_name,
+            glade,
+            module_files,
+            analysis.controller_class_name,
+            {f: getattr(analysis, f) for f in REQUIRED_FIELDS},
+        )
 
-        controller_ast = controller.load_controller_ast()
 
-        cls_ast, base_class, info.new_widget_name = c_class(
-            controller_ast, controller.module_name
+def merge_analysis(
+    collect_info: CollectInfo, analysis: ControllerAnalysis
+) -> Optional[CollectInfoEntry]:
+    controller = analysis.controller
+    info = collect_info.entry_for_controller(controller)
+    p_info(f"Processing {controller.controller_name} in {controller.module_name}.")
+    p_warns(analysis.warnings)
+    profiling.merge(analysis.profile)
+    if analysis.skipped:
+        return None
+
+    for f in apply_analysis(info, analysis, controller.glade_path):
+        value = getattr(info, f)
+        p_info(
+            f"Inferred {f} of {controller.controller_name} as {value} from {info.inferred[f]}."
+        )
+    collect_info.save(info)
+    return info
+
+
+def apply_analysis(
+    info: CollectInfoEntry,
+    analysis: ControllerAnalysis,
+    glade: Optional[GladeSource] = None,
+) -> List[str]:
+    """
+    Merges the analysis into info. Returns the fields that were newly inferred. glade
+    is the glade file of the controller, see merge_inferred.
+    """
+    info.merge(
+        controller_class_name=analysis.controller_class_name,
+        new_widget_name=analysis.new_widget_name,
+        module_class=analysis.module_class,
+        item_data_type=analysis.item_data_type,
+        extra_init_params=analysis.extra_init_params,
+        main_widget_name=analysis.main_widget_name,
+        main_widget_type=analysis.main_widget_type,
+    )
+    inferred = merge_inferred(info, analysis, glade)
+
+    if (
+        info.controller_hash != analysis.controller_hash
+        or info.glade_hash != analysis.glade_hash
+    ):
+        info.invalidate_outputs()
+    info.controller_hash = analysis.controller_hash
+    info.glade_hash = analysis.glade_hash
+    return inferred
+
+
+def merge_inferred(
+    info: CollectInfoEntry,
+    analysis: ControllerAnalysis,
+    glade: Optional[GladeSource] = None,
+) -> List[str]:
+    """
+    Fills fields that were not found directly with inferred values. Values entered by
+    the user are kept, previously inferred values are replaced or, if they can no
+    longer be inferred, forgotten. Returns the fields that were set to inferred values.
+    The inferred main widget type is only used for the main widget it was inferred
+    for. For another main widget name, its type is looked up in glade, if given.
+    """
+    inferred_name = analysis.inferred.get("main_widget_name", (None, None))[0]
+    merged = []
+    for f in REQUIRED_FIELDS:
+        if getattr(analysis, f) is not None:
+            info.inferred.pop(f, None)
+        elif f == "main_widget_type" and info.main_widget_name != inferred_name:
+            if _merge_main_widget_type(info, glade):
+                merged.append(f)
+        elif f in analysis.inferred:
+            if getattr(info, f) is None or f in info.inferred:
+                value, source = analysis.inferred[f]
+                setattr(info, f, value)
+                info.inferred[f] = source
+                merged.append(f)
+        elif f in info.inferred:
+            info.forget_inferred(f)
+    return merged
+
+
+def _merge_main_widget_type(
+    info: CollectInfoEntry, glade: Optional[GladeSource]
+) -> bool:
+    """
+    Looks up the type of the main widget of info in glade, unless the user entered
+    one. Returns whether it was set.
+    """
+    f = "main_widget_type"
+    if info.main_widget_type is not None and f not in info.inferred:
+        return False
+    value = None
+    if info.main_widget_name is not None and glade is not None:
+        value = c_main_widget_type(glade, info.main_widget_name)
+    if value is None:
+        if f in info.inferred:
+            info.forget_inferred(f)
+        return False
+    info.main_widget_type = value
+    info.inferred[f] = f"glade: object {info.main_widget_name}"
+    return True
+
+
+def missing_fields(info: CollectInfoEntry) -> List[str]:
+    return [f for f in REQUIRED_FIELDS if getattr(info, f) is None]
+
+
+def prompt_missing(
+    collect_info: CollectInfo, info: CollectInfoEntry, analysis: ControllerAnalysis
+):
+    """Asks for all missing fields and saves the entry after every answer."""
+    func_init = analysis.func_init
+    func_get_view = analysis.func_get_view
+    if info.new_widget_name is None:
+        info.new_widget_name = prompt("Please enter the new widget class name", None)
+        collect_info.save(info)
+    if info.module_class is None:
+        info.module_class = prompt(
+            "Please enter the module class", lambda: debout(func_init)
+        )
+        collect_info.save(info)
+    if info.main_widget_name is None:
+        info.main_widget_name = prompt(
+            "Please enter the main widget name", lambda: debout(func_get_view)
         )
-        if base_class != "AbstractController":
-            p_warn(f"Skipping because of not direct base class {base_class}...")
-            continue
-        assert cls_ast is not None
-        info.controller_class_name = cls_ast.name
-
-        glade_tree = controller.load_glade_tree()
-
-        (
-            func_init,
-            info.module_class,
-            info.item_data_type,
-            info.extra_init_params,
-        ) = c_params(cls_ast, controller)
-        func_get_view, info.main_widget_name, info.main_widget_type = c_main_widget(
-            cls_ast, glade_tree
+        collect_info.save(info)
+    if info.main_widget_type is None:
+        info.main_widget_type = prompt(
+            "Please enter the main widget type", lambda: debout(func_get_view)
         )
+        collect_info.save(info)
+    if info.item_data_type is None:
+        info.item_data_type = prompt(
+            "Please enter the item data type", lambda: debout(func_init)
+        )
+        collect_info.save(info)
 
-        if info.new_widget_name is None:
-            info.new_widget_name = prompt(
-                "Please enter the new widget class name", None
-            )
-        if info.module_class is None:
-            info.module_class = prompt(
-                "Please enter the module class", lambda: debout(func_init)
-            )
-        if info.main_widget_name is None:
-            info.main_widget_name = prompt(
-                "Please enter the main widget name", lambda: debout(func_get_view)
-            )
-        if info.main_widget_type is None:
-            info.main_widget_type = prompt(
-                "Please enter the main widget type", lambda: debout(func_get_view)
-            )
-        if info.item_data_type is None:
-            info.item_data_type = prompt(
-                "Please enter the item data type", lambda: debout(func_init)
-            )
+    p_debug(f"Output widget name {info.new_widget_name}.")
 
-        p_debug(f"Output widget name {info.new_widget_name}.")
 
+@dataclass
+class ControllerClassInfo:
+    """Everything Phase 1 collects from the AST of a controller class."""
 
-class BaseClassVisitor(ast.NodeVisitor):
-    classes: List[Tuple[str, str, ClassDef]]
+    node: ClassDef
+    base_class: str
+    new_widget_name: Optional[str] = None
+    func_init: Optional[FunctionDef] = None
+    module_class: Optional[str] = None
+    item_data_type: Optional[str] = None
+    extra_init_params: List[str] = field(default_factory=list)
+    func_get_view: Optional[FunctionDef] = None
+    main_widget_name: Optional[str] = None
+
+
+class ControllerVisitor(ast.NodeVisitor):
+    """
+    Collects all classes with a base class, their __init__ and get_view functions and
+    the widget returned by get_view, in a single traversal of the module.
+    """
+
+    classes: List[ControllerClassInfo]
+    _cls: Optional[ControllerClassInfo]
+    _get_view_variables: Optional[Dict[str, ast.expr]]
 
     def __init__(self):
         self.classes = []
+        self._cls = None
+        self._get_view_variables = None
 
     def visit_ClassDef(self, node: ClassDef):
-        if len(node.bases) < 1:
+        if len(node.bases) < 1 or self._cls is not None:
             return
         if len(node.bases) > 1:
             p_warn(f"Skipped class {node.name} because it has multiple bases.")
-        self.classes.append((node.name, assert_is(Name, node.bases[0]).id, node))
+        self._cls = ControllerClassInfo(node, assert_is(Name, node.bases[0]).id)
+        self.classes.append(self._cls)
+        self.generic_visit(node)
+        self._cls = None
 
+    def visit_FunctionDef(self, node: FunctionDef):
+        if self._cls is None:
+            # Module level function, it may still contain classes.
+            self.generic_visit(node)
+        elif self._get_view_variables is not None:
+            # Nested function in get_view, variables in here are not get_view's.
+            return
+        elif node.name == "__init__":
+            self._cls.func_init = node
+        elif node.name == "get_view":
+            self._cls.func_get_view = node
+            self._get_view_variables = {}
+            self.generic_visit(node)
+            self._get_view_variables = None
 
-def c_class(
+    def visit_Assign(self, node: Assign):
+        if self._get_view_variables is None:
+            return
+        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            var_name = node.targets[0].id
+            self._get_view_variables[var_name] = node.value
+
+    def visit_Return(self, node: Return):
+        if self._cls is None or self._get_view_variables is None:
+            return
+        p_debug(f"get_view return: {ast.dump(node)}")
+        value = node.value
+        if isinstance(value, ast.Name):
+            value = self._get_view_variables.get(value.id, None)
+        match value:
+            case ast.Call(func=ast.Name(id="builder_get_assert"), args=args):
+                last_arg = args[-1]
+                p_debug(f"Last arg: {ast.dump(last_arg)}")
+                match last_arg:
+                    case ast.Constant(value=name):
+                        self._cls.main_widget_name = name
+
+
+def analyze_controller_ast(
     tree: ast.AST, module_name: str
-) -> Tuple[Optional[ClassDef], Optional[str], Optional[str]]:
-    v = BaseClassVisitor()
+) -> Optional[ControllerClassInfo]:
+    """Picks the controller class of the module and returns what was collected about it."""
+    v = ControllerVisitor()
     v.visit(tree)
-    if len(v.classes) < 1:
-        return None, None, None
-    if len(v.classes) == 1:
-        return (
-            v.classes[0][2],
-            v.classes[0][1],
-            new_widget_name(v.classes[0][0], module_name),
-        )
-
-    filtered = [x for x in v.classes if x[0].endswith("Controller")]
+    cls = c_class(v.classes)
+    if cls is None:
+        return None
+    cls.new_widget_name = new_widget_name(cls.node.name, module_name)
+    if cls.func_init is not None:
+        c_params(cls, cls.func_init)
+    return cls
+
+
+def c_class(classes: List[ControllerClassInfo]) -> Optional[ControllerClassInfo]:
+    if len(classes) < 1:
+        return None
+    if len(classes) == 1:
+        return classes[0]
+
+    filtered = [x for x in classes if x.node.name.endswith("Controller")]
     if len(filtered) < 1:
         p_warn("Found multiple classes, but none ended in *Controller.")
-        return None, None, None
+        return None
     if len(filtered) > 1:
         p_warn("Found multiple classes, and multiple ended in *Controller.")
-    return filtered[0][2], filtered[0][1], new_widget_name(filtered[0][0], module_name)
+    return filtered[0]
 
 
 def new_widget_name(controller_class_name: str, module_name: str) -> Optional[str]:
@@ -110,105 +493,32 @@ def new_widget_name(controller_class_name: str, module_name: str) -> Optional[st
     return None
 
 
-class InitVisitor(ast.NodeVisitor):
-    func: Optional[FunctionDef]
-    module_class: Optional[str]
-    init_data_type: Optional[str]
-    extra_init_params: List[str]
-
-    def __init__(self):
-        self.func = None
-        self.module_class = None
-        self.init_data_type = None
-        self.extra_init_params = []
-
-    def visit_FunctionDef(self, node: FunctionDef):
-        if node.name == "__init__":
-            self.func = node
-            has_item_data = True
-            if len(node.args.args) < 3:
-                if len(node.args.args) == 2 and node.args.vararg is not None:
-                    has_item_data = False
-                else:
-                    p_warn(
-                        f"Unexpected __init__ argument list length: {len(node.args.args)}"
-                    )
-                    return
-            if node.args.args[0].arg != "self":
-                p_warn(f"First parameter to __init__ was not self.")
-                return
-            module_param = node.args.args[1]
-            self.module_class = parse_annotation(module_param.annotation)
-            if has_item_data:
-                item_data_param = node.args.args[2]
-                self.init_data_type = parse_annotation(item_data_param.annotation)
-                self.extra_init_params = [ast.unparse(x) for x in node.args.args[3:]]
-            else:
-                self.init_data_type = "None"
-
-
-def c_params(
-    tree: ClassDef, controller: ControllerAndGlade
-) -> Tuple[Optional[FunctionDef], Optional[str], Optional[str], List[str]]:
-    v = InitVisitor()
-    v.visit(tree)
-    return v.func, v.module_class, v.init_data_type, v.extra_init_params
-
-
-class GetViewReturnWidgetVisitor(ast.NodeVisitor):
-    func: Optional[FunctionDef]
-    main_widget_name: Optional[str]
-    simple_variables: Dict[str, ast.expr]
-
-    def __init__(self):
-        self.func = None
-        self.main_widget_name = None
-        self.simple_variables = {}
-
-    def visit_FunctionDef(self, node: FunctionDef):
-        if node.name == "get_view":
-            self.func = node
-            super().generic_visit(node)
-
-    def visit_Assign(self, node: Assign):
-        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
-            var_name = node.targets[0].id
-            self.simple_variables[var_name] = node.value
-
-    def visit_Return(self, node: Return):
-        p_debug(f"get_view return: {ast.dump(node)}")
-        match node.value:
-            case ast.Call(func=ast.Name(id="builder_get_assert"), args=args):
-                last_arg = args[-1]
-                p_debug(f"Last arg: {ast.dump(last_arg)}")
-                match last_arg:
-                    case ast.Constant(value=name):
-                        self.main_widget_name = name
-            case ast.Name(id=variable):
-                if variable in self.simple_variables:
-                    match self.simple_variables[variable]:
-                        case ast.Call(
-                            func=ast.Name(id="builder_get_assert"), args=args
-                        ):
-                            last_arg = args[-1]
-                            p_debug(f"Last arg: {ast.dump(last_arg)}")
-                            match last_arg:
-                                case ast.Constant(value=name):
-                                    self.main_widget_name = name
-
-
-def c_main_widget(
-    tree: ClassDef, glade_tree: ElementTree
-) -> Tuple[Optional[FunctionDef], Optional[str], Optional[str]]:
-    v = GetViewReturnWidgetVisitor()
-    v.visit(tree)
-
-    typ = None
-    if v.main_widget_name is not None:
-        obj = find_object(glade_tree.getroot(), v.main_widget_name)
-        if obj is not None:
-            typ = obj.py_class
-    return v.func, v.main_widget_name, typ
+def c_params(cls: ControllerClassInfo, node: FunctionDef):
+    has_item_data = True
+    if len(node.args.args) < 3:
+        if len(node.args.args) == 2 and node.args.vararg is not None:
+            has_item_data = False
+        else:
+            p_warn(f"Unexpected __init__ argument list length: {len(node.args.args)}")
+            return
+    if node.args.args[0].arg != "self":
+        p_warn(f"First parameter to __init__ was not self.")
+        return
+    module_param = node.args.args[1]
+    cls.module_class = parse_annotation(module_param.annotation)
+    if has_item_data:
+        item_data_param = node.args.args[2]
+        cls.item_data_type = parse_annotation(item_data_param.annotation)
+        cls.extra_init_params = [ast.unparse(x) for x in node.args.args[3:]]
+    else:
+        cls.item_data_type = "None"
+
+
+def c_main_widget_type(glade: GladeSource, main_widget_name: str) -> Optional[str]:
+    obj = scan_glade_object(glade, main_widget_name)
+    if obj is not None:
+        return obj.py_class
+    return None
 
 
 def debout(func_init: Optional[FunctionDef]) -> str:
@@ -1,13 +1,24 @@
-import os
+from typing import Optional, Collection
 
 from skytemple_view_migration import CollectInfo, p_info
+from skytemple_view_migration.phase_one import missing_fields
+from skytemple_view_migration.writer import OutputWriter
 
 
-def run_phase3(skytemple_directory: str, collect_info: CollectInfo):
+def run_phase3(
+    skytemple_directory: str,
+    collect_info: CollectInfo,
+    writer: Optional[OutputWriter] = None,
+    modules: Optional[Collection[str]] = None,
+):
     p_info("Starting Phase 3.")
+    if writer is None:
+        writer = OutputWriter()
     for entry in collect_info.entries.values():
-        if entry.module_class is None or entry.new_widget_name is None:
+        if len(missing_fields(entry)) > 0:
             continue
-        os.unlink(entry.glade_path)
-        os.unlink(entry.controller_path)
+        if modules is not None and entry.module_name not in modules:
+            continue
+        writer.unlink(entry.glade_path)
+        writer.unlink(entry.controller_path)
     p_info("Old files deleted.")
@@ -1,446 +1,972 @@
 import ast
+import json
 import os.path
 from _ast import Module, ClassDef, FunctionDef, Call
-from dataclasses import dataclass, field
-from pathlib import Path
-from typing import Set, Dict, Tuple, Optional, Any, List
-from xml.etree.ElementTree import ElementTree, Element
+from dataclasses import dataclass
+from functools import partial
+from xml.etree.ElementTree import ElementTree
+from typing import Set, Dict, Tuple, Optional, List, Collection, Sequence, Union
 
 import ast_comments
 
 from skytemple_view_migration import CollectInfo, p_info
+from skytemple_view_migration.cache import (
+    ParseCache,
+    SourceFile,
+    decode_source,
+    read_source_file,
+)
 from skytemple_view_migration.collect_info import CollectInfoEntry
+from skytemple_view_migration.formatting import format_widget_source, formatter_version
 from skytemple_view_migration.model import ControllerAndGlade
-from skytemple_view_migration.output import p_warn
-from skytemple_view_migration.ui_xml import BuilderObject
-from skytemple_view_migration.util import assert_not_none, assert_is
-
-
-def run_phase2(skytemple_directory: str, collect_info: CollectInfo):
+from skytemple_view_migration.output import (
+    p_warn,
+    capture_warnings,
+    p_warns,
+    p_debug,
+)
+from skytemple_view_migration import profiling
+from skytemple_view_migration.parallel import BackgroundQueue, map_pipelined
+from skytemple_view_migration.patching import SourcePatch
+from skytemple_view_migration.phase_one import missing_fields
+from skytemple_view_migration.profiling import section, ProfileRecords
+from skytemple_view_migration.rules import (
+    KEEP,
+    NOT_APPLIED,
+    Rule,
+    RuleResult,
+    RuleTransformer,
+)
+from skytemple_view_migration.ui_xml import GladeIndex, rewrite_template
+from skytemple_view_migration.snippets import Snippet, expression
+from skytemple_view_migration.writer import OutputWriter
+from skytemple_view_migration.util import (
+    assert_not_none,
+    content_hash,
+    file_hash,
+    is_identifier,
+)
+
+# Fields of an entry the generated outputs depend on, besides the input files.
+GENERATION_FIELDS = (
+    "module_name",
+    "controller_name",
+    "controller_class_name",
+    "module_class",
+    "main_widget_name",
+    "main_widget_type",
+    "item_data_type",
+    "new_widget_name",
+    "extra_init_params",
+)
+
+
+def run_phase2(
+    skytemple_directory: str,
+    collect_info: CollectInfo,
+    jobs: int = 1,
+    force: bool = False,
+    cache: Optional[ParseCache] = None,
+    writer: Optional[OutputWriter] = None,
+    modules: Optional[Collection[str]] = None,
+    format_widgets: bool = False,
+    patch_widgets: bool = False,
+    rules: Optional[Sequence[Rule]] = None,
+):
     p_info("Starting Phase 2.")
     sd_abs = os.path.abspath(skytemple_directory)
+    settings = generation_settings(format_widgets, patch_widgets, rules)
+    entries = []
+    unchanged = 0
     for entry in collect_info.entries.values():
-        if entry.module_class is None or entry.new_widget_name is None:
+        if len(missing_fields(entry)) > 0:
+            continue
+        if modules is not None and entry.module_name not in modules:
             continue
-        p_info(f"Processing {entry.controller_name} in {entry.module_name}.")
+        if not force and outputs_unchanged(sd_abs, entry, settings):
+            p_debug(f"Skipping unchanged {entry.controller_name}.")
+            unchanged += 1
+            continue
+        entries.append(entry)
+
+    generate_widgets(
+        sd_abs,
+        collect_info,
+        entries,
+        jobs,
+        cache,
+        writer,
+        format_widgets,
+        patch_widgets,
+        rules,
+    )
+
+    if unchanged > 0:
+        p_info(f"Skipped {unchanged} unchanged widgets.")
+
+
+def generate_widgets(
+    sd_abs: str,
+    collect_info: CollectInfo,
+    entries: List[CollectInfoEntry],
+    jobs: int = 1,
+    cache: Optional[ParseCache] = None,
+    writer: Optional[OutputWriter] = None,
+    format_widgets: bool = False,
+    patch_widgets: bool = False,
+    rules: Optional[Sequence[Rule]] = None,
+):
+    """
+    Generates and writes widgets for all entries and saves their new output hashes.
+    If format_widgets is set, widget modules are formatted with black in the workers.
+    If patch_widgets is set, they are made by patching the controller source.
+    rules are the rules to transform controllers with, by default all RULES.
+    """
+    if writer is None:
+        writer = OutputWriter()
+    settings = generation_settings(format_widgets, patch_widgets, rules)
+    prepared_dirs: Set[str] = set()
+    # The inputs are read ahead in I/O threads, generation runs here or in workers and
+    # the outputs are written in a background thread, all in the order of the entries.
+    with BackgroundQueue(profiling.merge) as writes:
+        for entry, generated in zip(
+            entries,
+            map_pipelined(
+                read_widget_inputs,
+                partial(
+                    generate_widget,
+                    cache=cache,
+                    format_widget=format_widgets,
+                    patch_widget=patch_widgets,
+                    rules=rules,
+                ),
+                entries,
+                jobs,
+            ),
+        ):
+            p_info(f"Processing {entry.controller_name} in {entry.module_name}.")
+            p_warns(generated.warnings)
+            profiling.merge(generated.profile)
+            writes.put(
+                write_widget,
+                sd_abs,
+                collect_info,
+                entry,
+                generated,
+                writer,
+                prepared_dirs,
+                settings,
+            )
+
+
+def generation_settings(
+    format_widgets: bool,
+    patch_widgets: bool = False,
+    rules: Optional[Sequence[Rule]] = None,
+) -> str:
+    """
+    Hash of the settings that affect the generated outputs. Outputs generated with
+    other settings are not unchanged.
+    """
+    settings = {
+        "format": formatter_version() if format_widgets else None,
+        "patch": patch_widgets,
+        "rules": [x.name for x in (RULES if rules is None else rules)],
+    }
+    return content_hash(json.dumps(settings, sort_keys=True).encode("utf-8"))
+
+
+def entry_settings(settings: str, entry: CollectInfoEntry) -> str:
+    """
+    Hash of the generation settings and the fields of the entry the outputs depend on,
+    which may also be edited by hand in the collect info JSON.
+    """
+    fields = {key: getattr(entry, key) for key in GENERATION_FIELDS}
+    return content_hash(json.dumps([settings, fields], sort_keys=True).encode("utf-8"))
+
+
+def outputs_unchanged(sd_abs: str, entry: CollectInfoEntry, settings: str) -> bool:
+    """
+    Whether the inputs did not change since Phase 1 and the outputs are still what we
+    generated, with the same settings and entry fields.
+    """
+    if (
+        entry.widget_hash is None
+        or entry.settings_hash != entry_settings(settings, entry)
+        or not entry.inputs_unchanged()
+    ):
+        return False
+    widget_path, ui_path = output_paths(sd_abs, entry)
+    return entry.widget_hash == file_hash(widget_path) and entry.ui_hash == file_hash(
+        ui_path
+    )
 
-        widget_out_dir = os.path.join(
-            sd_abs, "skytemple", "module", entry.module_name, "widget"
-        )
-        ui_out_dir = os.path.join(
-            sd_abs, "skytemple", "data", "widget", entry.module_name
-        )
-        os.makedirs(widget_out_dir, exist_ok=True)
-        Path(widget_out_dir).joinpath("__init__.py").touch()
-        os.makedirs(ui_out_dir, exist_ok=True)
 
-        widget_path = os.path.join(widget_out_dir, f"{entry.controller_name}.py")
-        ui_path = os.path.join(ui_out_dir, f"{entry.controller_name}.ui")
+@dataclass
+class GeneratedWidget:
+    widget_source: str
+    ui_source: bytes
+    warnings: List[str]
+    profile: Optional[ProfileRecords]
+
+
+def write_widget(
+    sd_abs: str,
+    collect_info: CollectInfo,
+    entry: CollectInfoEntry,
+    generated: GeneratedWidget,
+    writer: OutputWriter,
+    prepared_dirs: Set[str],
+    settings: str,
+) -> Optional[ProfileRecords]:
+    """
+    Writes the outputs of an entry and saves its new output hashes. Returns the profile
+    of that, since it runs in a background thread.
+    """
+    with (
+        profiling.capture() as profile,
+        section(f"{entry.module_name}/{entry.controller_name}"),
+        section("write"),
+    ):
+        widget_path, ui_path = output_paths(sd_abs, entry)
+        prepare_output_dirs(widget_path, ui_path, prepared_dirs, writer)
+        widget_source = generated.widget_source.encode("utf-8")
+        writer.write(widget_path, widget_source)
+        writer.write(ui_path, generated.ui_source)
+    entry.widget_hash = content_hash(widget_source)
+    entry.ui_hash = content_hash(generated.ui_source)
+    entry.settings_hash = entry_settings(settings, entry)
+    collect_info.save(entry)
+    return profile
+
 
+@dataclass
+class WidgetInputs:
+    """The controller and glade file of an entry, read ahead of generating its widget."""
+
+    entry: CollectInfoEntry
+    controller: SourceFile
+    glade: SourceFile
+    profile: Optional[ProfileRecords]
+
+
+def read_widget_inputs(entry: CollectInfoEntry) -> WidgetInputs:
+    """Reads the inputs of an entry. Safe to run in a thread."""
+    with profiling.capture() as profile:
+        with section("read controller"):
+            controller = read_source_file(entry.controller_path)
+        with section("read glade"):
+            glade = read_source_file(entry.glade_path)
+    return WidgetInputs(entry, controller, glade, profile)
+
+
+def generate_widget(
+    inputs: WidgetInputs,
+    cache: Optional[ParseCache] = None,
+    format_widget: bool = False,
+    patch_widget: bool = False,
+    rules: Optional[Sequence[Rule]] = None,
+) -> GeneratedWidget:
+    """Generates the widget module and UI template of an entry. Safe to run in a worker process."""
+    entry = inputs.entry
+    with (
+        capture_warnings() as warnings,
+        profiling.capture() as profile,
+        section(f"{entry.module_name}/{entry.controller_name}"),
+    ):
+        profiling.merge(inputs.profile)
         controller = ControllerAndGlade(
             entry.module_name,
             entry.controller_name,
             entry.controller_path,
             entry.glade_path,
         )
-        controller_ast = controller.load_controller_ast()
-        ui_tree = controller.load_glade_tree()
-        widget_ast = transform_widget_ast(controller_ast, ui_tree, entry)
+        with section("parse controller"):
+            controller_ast = controller.load_controller_ast(cache, inputs.controller)
+        controller_source = None
+        if patch_widget:
+            controller_source = decode_source(inputs.controller.content)
+        with section("parse glade"):
+            ui_tree = controller.load_glade_tree(cache, True, inputs.glade)
+        widget_source, ui_source = generate_widget_from_trees(
+            entry,
+            controller_ast,
+            ui_tree,
+            inputs.glade.content,
+            cache,
+            format_widget,
+            controller_source,
+            rules,
+        )
+    return GeneratedWidget(widget_source, ui_source, warnings, profile)
+
+
+def generate_widget_from_trees(
+    entry: CollectInfoEntry,
+    controller_ast: ast.AST,
+    ui_tree: ElementTree,
+    glade_source: bytes,
+    cache: Optional[ParseCache] = None,
+    format_widget: bool = False,
+    controller_source: Optional[str] = None,
+    rules: Optional[Sequence[Rule]] = None,
+) -> Tuple[str, bytes]:
+    """
+    Generates the widget module source and UI template from the parsed controller
+    (which is modified), the parsed glade file and its content. The paths of entry
+    are not used.
+    If the controller source is given, the widget module is made by patching the
+    changes into it, instead of unparsing the whole transformed AST. Controllers with
+    single-line suites are unparsed anyway, their bodies can not be edited by line.
+    """
+    with section("index glade"):
+        glade_index = GladeIndex(assert_not_none(ui_tree.getroot()))
+    patch = None
+    if controller_source is not None:
+        if _has_single_line_suite(controller_ast):
+            p_warn("Contains single-line suites, unparsing instead of patching.")
+        else:
+            patch = SourcePatch(controller_source)
+    with section("transform widget"):
+        widget_ast = transform_widget_ast(
+            controller_ast, glade_index, entry, patch, rules
+        )
 
-        with open(widget_path, "w") as f:
+    if patch is not None:
+        with section("patch widget"):
+            body = patch.apply()
+    else:
+        with section("unparse widget"):
             # We remove all type: ignore's because they may be misplaced now.
             body = ast_comments.unparse(widget_ast).replace("# type: ignore", "")
-            if "self.builder" in body or "self._builder" in body:
-                p_warn("Still contains builder references.")
-            f.write(body)
-
-        transform_ui_tree(ui_tree, entry)
-
-        with open(ui_path, "wb") as f:
-            ui_tree.write(f, encoding="utf-8", xml_declaration=True)
-
-
-@dataclass
-class ActionsControllerToWidget:
+    if "self.builder" in body or "self._builder" in body:
+        p_warn("Still contains builder references.")
+    if format_widget:
+        with section("format widget"):
+            body = format_widget_source(body, cache)
+
+    with section("transform ui"):
+        ui_source = transform_ui_source(glade_source, entry)
+    return body, ui_source
+
+
+def output_paths(sd_abs: str, entry: CollectInfoEntry) -> Tuple[str, str]:
+    """Returns the widget module and UI file paths of an entry."""
+    return (
+        os.path.join(
+            sd_abs,
+            "skytemple",
+            "module",
+            entry.module_name,
+            "widget",
+            f"{entry.controller_name}.py",
+        ),
+        os.path.join(
+            sd_abs,
+            "skytemple",
+            "data",
+            "widget",
+            entry.module_name,
+            f"{entry.controller_name}.ui",
+        ),
+    )
+
+
+def prepare_output_dirs(
+    widget_path: str, ui_path: str, prepared_dirs: Set[str], writer: OutputWriter
+):
+    """Makes sure the output directories exist. Directories already in prepared_dirs are skipped."""
+    widget_out_dir = os.path.dirname(widget_path)
+    ui_out_dir = os.path.dirname(ui_path)
+    if widget_out_dir not in prepared_dirs:
+        writer.makedirs(widget_out_dir)
+        writer.touch(os.path.join(widget_out_dir, "__init__.py"))
+        prepared_dirs.add(widget_out_dir)
+    if ui_out_dir not in prepared_dirs:
+        writer.makedirs(ui_out_dir)
+        prepared_dirs.add(ui_out_dir)
+
+
+IMPORT_FUTURE_ANNOTATIONS = Snippet("from __future__ import annotations")
+IMPORT_DATA_DIR = Snippet("from skytemple.core.ui_utils import data_dir")
+IMPORT_OS = Snippet("import os")
+IMPORT_CAST = Snippet("from typing import cast")
+GTK_TEMPLATE = Snippet(
+    'Gtk.Template(filename=os.path.join(data_dir(), "widget", "MODULE", "FILENAME"))',
+    "MODULE",
+    "FILENAME",
+)
+GTYPE_NAME = Snippet('__gtype_name__ = "NAME"', "NAME")
+MODULE_ATTR = Snippet("module: TYPE", "TYPE")
+ITEM_DATA_ATTR = Snippet("item_data: TYPE", "TYPE")
+CHILD = Snippet("NAME: TYPE = cast(TYPE, Gtk.Template.Child())", "NAME", "TYPE")
+RENAMED_CHILD = Snippet(
+    'NAME: TYPE = cast(TYPE, Gtk.Template.Child("ID"))', "NAME", "TYPE", "ID"
+)
+GTK_TEMPLATE_CALLBACK = Snippet("Gtk.Template.Callback()")
+SUPER_INIT = Snippet("super().__init__()")
+SET_MODULE = Snippet("self.module = VALUE", "VALUE")
+SET_ITEM_DATA = Snippet("self.item_data = VALUE", "VALUE")
+SELF_ATTR = Snippet("self.NAME", "NAME")
+SELF_GETATTR = Snippet("getattr(self, NAME)", "NAME")
+
+
+class ControllerToWidgetTransformer(RuleTransformer):
     """
-    - mod: Adds __future__ annotations, removes AbstractController, builder_get_assert imports
-    - cls: Add Gtk.Template decorator to class
-    - cls: Change class name, change base
-    - cls: Add __gtype_name__ to class
-    - cls: Adds module and item data attributes to class
-    - cls: Adds child widgets to class
-    - cls: Merges __init__ and get_view into __init__
-    - fun: Adds callbacks to signal handlers
-    - fun: Add super call to __init__
-    - fun: Remove self.builder = from __init__
-    - fun: Removes return from __init__
-    - cll: Replaces all builder_get_assert([self.]builder, <TY>, <NAME>) with self.<NAME>
+    Transforms the controller AST into the widget AST by running the rules (RULES by
+    default) on it. If a patch of the controller source is given, every change is
+    also recorded as an edit of it.
     """
 
-    mod_add_imports: bool = field(default=False)
-    cls_add_gtk_template: bool = field(default=False)
-    cls_change_class: bool = field(default=False)
-    cls_add_gtype_name: bool = field(default=False)
-    cls_add_mod_itm_data: bool = field(default=False)
-    cls_add_child_wdgs: bool = field(default=False)
-    cls_merge_init_get_view: bool = field(default=False)
-    fun_add_callbacks: bool = field(default=False)
-    fun_add_super: bool = field(default=False)
-    fun_remove_builder: bool = field(default=False)
-    fun_remove_init_ret: bool = field(default=False)
-    cll_replace_builder: bool = field(default=False)
-
-    def assert_done(self):
-        for k, v in self.__dict__.items():
-            if not v:
-                raise AssertionError(f"Did not {k}")
-
-
-class ControllerToWidgetTransformer(ast.NodeTransformer):
-    actions_done: ActionsControllerToWidget
     info: CollectInfoEntry
     widgets: Dict[str, str]
     signal_handlers: Set[str]
     widget_renames: Dict[str, str]
+    patch: Optional[SourcePatch]
+    # The class that is migrated and its first statement, once it was found.
+    controller_class: Optional[ClassDef]
+    class_first: Optional[ast.stmt]
+    # Number of statements added to the start of the controller class.
+    class_statements: int
 
     def __init__(
         self,
         info: CollectInfoEntry,
         widgets: Dict[str, str],
         signal_handlers: Set[str],
+        patch: Optional[SourcePatch] = None,
+        rules: Optional[Sequence[Rule]] = None,
+        timed: bool = False,
     ):
-        self.actions_done = ActionsControllerToWidget()
+        super().__init__(RULES if rules is None else rules, timed)
         self.info = info
         self.widgets = widgets
         self.signal_handlers = signal_handlers
         self.widget_renames = {}
+        self.patch = patch
+        self.controller_class = None
+        self.class_first = None
+        self.class_statements = 0
 
-    def visit_Module(self, node: Module) -> ast.AST:
-        # Imports:
-        new_body: List[ast.stmt] = []
-        inserted_from_future = False
-        has_os_import = False
-        has_data_dir_import = False
-        has_typing_cast = False
-        for i in range(0, len(node.body)):
-            append_this = True
-            this_n = node.body[i]
-            if isinstance(this_n, ast.Import):
-                for n in this_n.names:
-                    if n.name == "os":
-                        has_os_import = True
-            elif isinstance(this_n, ast.ImportFrom):
-                if this_n.module == "skytemple.core.module_controller":
-                    this_n.names = [
-                        x for x in this_n.names if x.name != "AbstractController"
-                    ]
-                    if len(this_n.names) < 1:
-                        append_this = (
-                            False  # skip this import from statement, it is now empty.
-                        )
-                elif this_n.module == "skytemple.core.ui_utils":
-                    this_n.names = [
-                        x for x in this_n.names if x.name != "builder_get_assert"
-                    ]
-                    l_has_data_dir = False
-                    for n in this_n.names:
-                        if n.name == "data_dir":
-                            l_has_data_dir = True
-                    if not l_has_data_dir:
-                        this_n.names.append(ast.alias(name="data_dir"))
-                    has_data_dir_import = True
-                    if len(this_n.names) < 1:
-                        append_this = (
-                            False  # skip this import from statement, it is now empty.
-                        )
-                elif this_n.module == "typing":
-                    l_has_cast = False
-                    for n in this_n.names:
-                        if n.name == "cast":
-                            l_has_cast = True
-                    if not l_has_cast:
-                        this_n.names.append(ast.alias(name="cast"))
-                    has_typing_cast = True
-
-            if append_this:
-                new_body.append(this_n)
-
-            next_i = i + 1
-            if next_i < len(node.body):
-                next_n = node.body[next_i]
-                if not inserted_from_future and (
-                    isinstance(next_n, ast.Import) or isinstance(next_n, ast.ImportFrom)
-                ):
-                    inserted_from_future = True
-                    match next_n:
-                        case ast.ImportFrom(module="__future__"):
-                            # already exists, probably.
-                            assert (
-                                len(
-                                    [x for x in next_n.names if x.name == "annotations"]
-                                )
-                                > 0
-                            )
-                        case _:
-                            new_body.append(stmt("from __future__ import annotations"))
-                if isinstance(next_n, ast.ClassDef):
-                    if not has_data_dir_import:
-                        new_body.append(
-                            stmt(
-                                "from skytemple.core.ui_utils import data_dir",
-                            )
-                        )
-
-                    if not has_os_import:
-                        new_body.append(stmt("import os"))
-
-                    if not has_typing_cast:
-                        new_body.append(
-                            stmt(
-                                "from typing import cast",
-                            )
-                        )
+    def is_controller_class(self, node: ClassDef) -> bool:
+        if (
+            self.controller_class is None
+            and node.name == self.info.controller_class_name
+        ):
+            self.controller_class = node
+            self.class_first = _statements(node.body)[0]
+        return node is self.controller_class
+
+    def is_controller_method(self, node: FunctionDef) -> bool:
+        """Whether node is a method of the controller class itself."""
+        return self.controller_class is not None and any(
+            x is node for x in self.controller_class.body
+        )
 
-        node.body = new_body
-        self.actions_done.mod_add_imports = True
+    def insert_class_statement(self, node: ClassDef, snippet: Snippet, **values: str):
+        """Adds a statement to the start of the controller class, after those added before."""
+        node.body.insert(self.class_statements, snippet.stmt(**values))
+        if self.patch is not None:
+            first = assert_not_none(self.class_first)
+            self.patch.insert_before(first, snippet.source(**values))
+            if self.class_statements == 0 and isinstance(
+                first, (FunctionDef, ast.AsyncFunctionDef, ClassDef)
+            ):
+                self.patch.insert_before(first, "", attached=True)
+        self.class_statements += 1
 
-        ret = self.generic_visit(node)
-        self.actions_done.assert_done()
-        return ret
+    def remove(self, node: ast.stmt) -> RuleResult:
+        """Returns None to remove the statement from the AST and deletes it from the patch."""
+        if self.patch is not None:
+            self.patch.delete(node)
+        return None
 
-    def visit_ClassDef(self, node: ClassDef) -> ast.AST:
-        if node.name != self.info.controller_class_name:
-            return node
-        # Add Gtk.Template decorator to class
-        node.decorator_list.append(
-            expr(
-                f'Gtk.Template(filename=os.path.join(data_dir(), "widget", "{self.info.module_name}", "{self.info.controller_name}.ui"))',
+    def patch_import(self, node: ast.ImportFrom, old_names: List[ast.alias]):
+        if self.patch is None or node.names == old_names:
+            return
+        if len(node.names) < 1:
+            self.patch.delete(node)
+        elif node.names[: len(old_names)] == old_names:
+            # Only added names, the existing ones are kept as they are written.
+            last = old_names[-1]
+            self.patch.insert(
+                assert_not_none(last.end_lineno),
+                assert_not_none(last.end_col_offset),
+                "".join(f", {x.name}" for x in node.names[len(old_names) :]),
             )
-        )
-        self.actions_done.cls_add_gtk_template = True
+        else:
+            self.patch.replace(node, ast.unparse(node))
 
-        # Change class name, change base
-        node.name = assert_not_none(self.info.new_widget_name)
-        node.bases = [expr(assert_not_none(self.info.main_widget_type))]
-        self.actions_done.cls_change_class = True
+    def patch_insert(
+        self, previous: ast.stmt, following: ast.stmt, statements: List[ast.stmt]
+    ):
+        """Inserts statements between two statements of the module."""
+        if self.patch is None or len(statements) < 1:
+            return
+        lines = [ast.unparse(x) for x in statements]
+        if _is_inline_comment(previous):
+            # This is within or after the statement before it, not on a line of its own.
+            self.patch.insert_before(following, *lines)
+        else:
+            self.patch.insert_after(previous, *lines)
+
+    def patch_class_header(self, node: ClassDef):
+        """Replaces the name and the bases of the class in the source. Keywords are kept."""
+        assert self.patch is not None
+        header = self.patch.segment(node).split("\n", 1)[0]
+        name_col = node.col_offset + len(
+            header[: header.index(node.name, len("class"))].encode("utf-8")
+        )
+        name = ast.Name(
+            id=node.name,
+            lineno=node.lineno,
+            col_offset=name_col,
+            end_lineno=node.lineno,
+            end_col_offset=name_col + len(node.name.encode("utf-8")),
+        )
+        self.patch.replace(name, assert_not_none(self.info.new_widget_name))
+        base = assert_not_none(self.info.main_widget_type)
+        if len(node.bases) > 0:
+            bases = ast.Tuple(
+                elts=[],
+                lineno=node.bases[0].lineno,
+                col_offset=node.bases[0].col_offset,
+                end_lineno=node.bases[-1].end_lineno,
+                end_col_offset=node.bases[-1].end_col_offset,
+            )
+            self.patch.replace(bases, base)
+        elif len(node.keywords) > 0:
+            keyword = node.keywords[0]
+            self.patch.insert(keyword.lineno, keyword.col_offset, f"{base}, ")
+        else:
+            self.patch.insert(
+                name.lineno, assert_not_none(name.end_col_offset), f"({base})"
+            )
 
-        # Add __gtype_name__ to class
-        node.body.insert(0, stmt(f'__gtype_name__ = "{self.info.new_widget_name}"'))
-        self.actions_done.cls_add_gtype_name = True
 
-        # Adds module and item data attributes to class
-        node.body.insert(1, stmt(f"module: {self.info.module_class}"))
-        node.body.insert(
-            2, stmt(f"item_data: {assert_not_none(self.info.item_data_type)}")
+def fix_imports(t: ControllerToWidgetTransformer, node: Module) -> RuleResult:
+    """
+    Adds the __future__ annotations, data_dir, os and cast imports and removes the
+    AbstractController and builder_get_assert imports.
+    """
+    new_body: List[ast.stmt] = []
+    inserted_from_future = False
+    has_os_import = False
+    has_data_dir_import = False
+    has_typing_cast = False
+    for i in range(0, len(node.body)):
+        append_this = True
+        this_n = node.body[i]
+        if isinstance(this_n, ast.Import):
+            for n in this_n.names:
+                if n.name == "os":
+                    has_os_import = True
+        elif isinstance(this_n, ast.ImportFrom):
+            old_names = list(this_n.names)
+            if this_n.module == "skytemple.core.module_controller":
+                this_n.names = [
+                    x for x in this_n.names if x.name != "AbstractController"
+                ]
+                if len(this_n.names) < 1:
+                    append_this = (
+                        False  # skip this import from statement, it is now empty.
+                    )
+            elif this_n.module == "skytemple.core.ui_utils":
+                this_n.names = [
+                    x for x in this_n.names if x.name != "builder_get_assert"
+                ]
+                l_has_data_dir = False
+                for n in this_n.names:
+                    if n.name == "data_dir":
+                        l_has_data_dir = True
+                if not l_has_data_dir:
+                    this_n.names.append(ast.alias(name="data_dir"))
+                has_data_dir_import = True
+                if len(this_n.names) < 1:
+                    append_this = (
+                        False  # skip this import from statement, it is now empty.
+                    )
+            elif this_n.module == "typing":
+                l_has_cast = False
+                for n in this_n.names:
+                    if n.name == "cast":
+                        l_has_cast = True
+                if not l_has_cast:
+                    this_n.names.append(ast.alias(name="cast"))
+                has_typing_cast = True
+            t.patch_import(this_n, old_names)
+
+        if append_this:
+            new_body.append(this_n)
+
+        next_i = i + 1
+        if next_i < len(node.body):
+            next_n = node.body[next_i]
+            if not inserted_from_future and (
+                isinstance(next_n, ast.Import) or isinstance(next_n, ast.ImportFrom)
+            ):
+                inserted_from_future = True
+                match next_n:
+                    case ast.ImportFrom(module="__future__"):
+                        # already exists, probably.
+                        assert (
+                            len([x for x in next_n.names if x.name == "annotations"])
+                            > 0
+                        )
+                    case _:
+                        new_body.append(IMPORT_FUTURE_ANNOTATIONS.stmt())
+                        t.patch_insert(this_n, next_n, new_body[-1:])
+            if isinstance(next_n, ast.ClassDef):
+                added_from = len(new_body)
+                if not has_data_dir_import:
+                    new_body.append(IMPORT_DATA_DIR.stmt())
+
+                if not has_os_import:
+                    new_body.append(IMPORT_OS.stmt())
+
+                if not has_typing_cast:
+                    new_body.append(IMPORT_CAST.stmt())
+                t.patch_insert(this_n, next_n, new_body[added_from:])
+
+    node.body = new_body
+    return node
+
+
+def skip_other_classes(t: ControllerToWidgetTransformer, node: ClassDef) -> RuleResult:
+    """Leaves all classes but the controller class (and everything in them) as they are."""
+    return NOT_APPLIED if t.is_controller_class(node) else KEEP
+
+
+def add_template_decorator(
+    t: ControllerToWidgetTransformer, node: ClassDef
+) -> RuleResult:
+    """Adds the Gtk.Template decorator to the controller class."""
+    if not t.is_controller_class(node):
+        return NOT_APPLIED
+    values = {
+        "MODULE": t.info.module_name,
+        "FILENAME": f"{t.info.controller_name}.ui",
+    }
+    if t.patch is not None:
+        t.patch.insert_before(
+            node,
+            f"@{GTK_TEMPLATE.source(**values)}",
+            decorators=False,
+            attached=True,
         )
-        self.actions_done.cls_add_mod_itm_data = True
-
-        self.widget_renames = {}
-        # Adds child widgets to class
-        for name, clazz in reversed(self.widgets.items()):
-            # If we get a syntax error, then the widget has a reserved name. Rename it.
-            try:
-                node.body.insert(
-                    3, stmt(f"{name}: {clazz} = cast({clazz}, Gtk.Template.Child())")
-                )
-            except SyntaxError:
-                node.body.insert(
-                    3,
-                    stmt(
-                        f'{name}_widget: {clazz} = cast({clazz}, Gtk.Template.Child("{name}"))'
-                    ),
-                )
-                self.widget_renames[name] = f"{name}_widget"
-        self.actions_done.cls_add_child_wdgs = True
-
-        # Merges __init__ and get_view into __init__
-        f_init: Optional[FunctionDef] = None
-        f_get_view: Optional[FunctionDef] = None
-        new_body = []
-        for child in node.body:
-            if isinstance(child, FunctionDef):
-                if child.name == "__init__":
-                    f_init = child
-                elif child.name == "get_view":
-                    f_get_view = child
-                    continue  # continue so we remove it.
-            new_body.append(child)
-        assert f_init is not None and f_get_view is not None
-        f_init.body.extend(f_get_view.body)
-        node.body = new_body
-        self.actions_done.cls_merge_init_get_view = True
-
-        return self.generic_visit(node)
-
-    def visit_FunctionDef(self, node: FunctionDef) -> ast.AST:
-        # Adds callbacks to signal handlers
-        if node.name in self.signal_handlers:
-            node.decorator_list.insert(
-                0,
-                expr(
-                    "Gtk.Template.Callback()",
-                ),
+    node.decorator_list.append(GTK_TEMPLATE.expr(**values))
+    return node
+
+
+def change_class(t: ControllerToWidgetTransformer, node: ClassDef) -> RuleResult:
+    """Renames the controller class and makes the main widget type its base."""
+    if not t.is_controller_class(node):
+        return NOT_APPLIED
+    if t.patch is not None:
+        t.patch_class_header(node)
+    node.name = assert_not_none(t.info.new_widget_name)
+    node.bases = [expression(assert_not_none(t.info.main_widget_type))]
+    return node
+
+
+def add_gtype_name(t: ControllerToWidgetTransformer, node: ClassDef) -> RuleResult:
+    """Adds __gtype_name__ to the controller class."""
+    if not t.is_controller_class(node):
+        return NOT_APPLIED
+    t.insert_class_statement(
+        node, GTYPE_NAME, NAME=assert_not_none(t.info.new_widget_name)
+    )
+    return node
+
+
+def add_module_attributes(
+    t: ControllerToWidgetTransformer, node: ClassDef
+) -> RuleResult:
+    """Adds the module and item data attributes to the controller class."""
+    if not t.is_controller_class(node):
+        return NOT_APPLIED
+    t.insert_class_statement(
+        node, MODULE_ATTR, TYPE=assert_not_none(t.info.module_class)
+    )
+    t.insert_class_statement(
+        node, ITEM_DATA_ATTR, TYPE=assert_not_none(t.info.item_data_type)
+    )
+    return node
+
+
+def add_child_widgets(t: ControllerToWidgetTransformer, node: ClassDef) -> RuleResult:
+    """Adds a template child to the controller class for every other widget."""
+    if not t.is_controller_class(node):
+        return NOT_APPLIED
+    t.widget_renames = {}
+    for name, clazz in t.widgets.items():
+        # Widgets with reserved names can not be used as attribute names. Rename them.
+        if is_identifier(name):
+            t.insert_class_statement(node, CHILD, NAME=name, TYPE=clazz)
+        else:
+            t.insert_class_statement(
+                node, RENAMED_CHILD, NAME=f"{name}_widget", TYPE=clazz, ID=name
             )
-        self.actions_done.fun_add_callbacks = True
-
-        if node.name == "__init__":
-            # Add super call to __init__
-            node.body.insert(0, stmt("super().__init__()"))
-            node.body.insert(1, stmt(f"self.module = {node.args.args[1].arg}"))
-            if len(node.args.args) > 2:
-                node.body.insert(2, stmt(f"self.item_data = {node.args.args[2].arg}"))
-            else:
-                node.body.insert(2, stmt(f"self.item_data = None"))
-            self.actions_done.fun_add_super = True
-
-            # Removes return from __init__
-            last_child = node.body[-1]
-            if isinstance(last_child, ast.Return):
-                node.body.remove(last_child)
-            self.actions_done.fun_remove_init_ret = True
-
-        return self.generic_visit(node)
-
-    def visit_Assert(self, node: ast.Assert) -> Optional[ast.AST]:
-        match node.test:
-            case ast.Attribute(value=ast.Name(id="self"), attr="builder"):
-                return None
-            case ast.Attribute(value=ast.Name(id="self"), attr="_builder"):
-                return None
-        return self.generic_visit(node)
-
-    def visit_Assign(self, node: ast.Assign) -> Optional[ast.AST]:
-        # Remove self.builder =
-        self.actions_done.fun_remove_builder = True
-        if len(node.targets) == 1:
-            match node.targets[0]:
-                case ast.Attribute(value=ast.Name(id="self"), attr="builder"):
-                    return None
-                case ast.Attribute(value=ast.Name(id="self"), attr="_builder"):
-                    return None
-        match node.value:
-            case ast.Call(
-                func=ast.Attribute(value=ast.Name(id="self"), attr="_get_builder")
-            ):
-                return None
-        return self.generic_visit(node)
-
-    def visit_AnnAssign(self, node: ast.AnnAssign) -> Optional[ast.AST]:
-        # Remove self.builder =
-        self.actions_done.fun_remove_builder = True
-        match node.target:
-            case ast.Attribute(value=ast.Name(id="self"), attr="builder"):
-                return None
-            case ast.Attribute(value=ast.Name(id="self"), attr="_builder"):
-                return None
-        match node.value:
-            case ast.Call(
-                func=ast.Attribute(value=ast.Name(id="self"), attr="_get_builder")
-            ):
-                return None
-        return self.generic_visit(node)
+            t.widget_renames[name] = f"{name}_widget"
+    return node
+
+
+def merge_init_get_view(t: ControllerToWidgetTransformer, node: ClassDef) -> RuleResult:
+    """Moves the body of get_view to the end of __init__ and removes get_view."""
+    if not t.is_controller_class(node):
+        return NOT_APPLIED
+    f_init: Optional[FunctionDef] = None
+    f_get_view: Optional[FunctionDef] = None
+    new_body = []
+    for child in node.body:
+        if isinstance(child, FunctionDef):
+            if child.name == "__init__":
+                f_init = child
+            elif child.name == "get_view":
+                f_get_view = child
+                continue  # continue so we remove it.
+        new_body.append(child)
+    assert f_init is not None and f_get_view is not None
+    if t.patch is not None:
+        t.patch.move_after(f_init, _statements(f_get_view.body))
+        t.patch.delete(f_get_view, blank_lines_before=True)
+    f_init.body.extend(f_get_view.body)
+    node.body = new_body
+    return node
+
+
+def add_template_callbacks(
+    t: ControllerToWidgetTransformer, node: FunctionDef
+) -> RuleResult:
+    """Adds the Gtk.Template.Callback decorator to signal handlers of the glade file."""
+    if node.name not in t.signal_handlers or not t.is_controller_method(node):
+        return NOT_APPLIED
+    if t.patch is not None:
+        t.patch.insert_before(node, f"@{GTK_TEMPLATE_CALLBACK.source()}", attached=True)
+    node.decorator_list.insert(0, GTK_TEMPLATE_CALLBACK.expr())
+    return node
+
+
+def init_super(t: ControllerToWidgetTransformer, node: FunctionDef) -> RuleResult:
+    """Starts __init__ with the super call and setting the module and item data."""
+    if (
+        node.name != "__init__"
+        or len(node.args.args) < 2
+        or not t.is_controller_method(node)
+    ):
+        return NOT_APPLIED
+    first = _statements(node.body)[0]
+    item_data = node.args.args[2].arg if len(node.args.args) > 2 else "None"
+    node.body[0:0] = [
+        SUPER_INIT.stmt(),
+        SET_MODULE.stmt(VALUE=node.args.args[1].arg),
+        SET_ITEM_DATA.stmt(VALUE=item_data),
+    ]
+    if t.patch is not None:
+        t.patch.insert_before(
+            first,
+            SUPER_INIT.source(),
+            SET_MODULE.source(VALUE=node.args.args[1].arg),
+            SET_ITEM_DATA.source(VALUE=item_data),
+        )
+    return node
 
-    def visit_Expr(self, node: ast.Expr) -> Optional[ast.AST]:
-        nnode = self.generic_visit(node)
-        # This can happen if a call is removed below.
-        if not hasattr(nnode, "value"):
-            return None
-        return nnode
-
-    def visit_Call(self, node: Call) -> Optional[ast.AST]:
-        new_node: ast.AST = node
-        match node.func:
-            # Remove connect signals.
-            case ast.Attribute(
-                value=ast.Attribute(value=ast.Name(id="self"), attr="builder"),
-                attr="connect_signals",
-            ):
-                return None
-            case ast.Attribute(
-                value=ast.Attribute(value=ast.Name(id="self"), attr="_builder"),
-                attr="connect_signals",
-            ):
-                return None
-            # Replaces all builder_get_assert([self.]builder, <TY>, <NAME>) with self.<NAME>
-            case ast.Name(id="builder_get_assert"):
-                match node.args[2]:
-                    case ast.Constant(value=widget_name):
-                        if widget_name in self.widget_renames:
-                            widget_name = self.widget_renames[widget_name]
-                        new_node = expr(f"self.{widget_name}")
-                    case ast.JoinedStr(values):
-                        if len(values) == 1:
-                            assert isinstance(values[0], ast.Constant)
-                            widget_name = values[0].value
-                            if widget_name in self.widget_renames:
-                                widget_name = self.widget_renames[widget_name]
-                            new_node = expr(f"self.{widget_name}")
-                        else:
-                            new_node = expr(
-                                f"getattr(self, {ast.unparse(node.args[2])})"
-                            )
-                    case ast.Name(id=var_name):
-                        new_node = expr(f"getattr(self, {var_name})")
-                    case other:
-                        raise AssertionError(other)
-        self.actions_done.cll_replace_builder = True
-
-        return self.generic_visit(new_node)
-
-
-def collect_widgets(
-    node: Element,
-    accu_wdgs: Optional[Dict[str, str]] = None,
-    accu_sigh: Optional[Set[str]] = None,
-) -> Tuple[Dict[str, str], Set[str]]:
-    if accu_wdgs is None:
-        accu_wdgs = {}
-    if accu_sigh is None:
-        accu_sigh = set()
-
-    if node.tag == "object" and "id" in node.attrib and "class" in node.attrib:
-        accu_wdgs[node.attrib["id"]] = BuilderObject(
-            None, node.attrib["class"]
-        ).py_class
-    if node.tag == "signal" and "handler" in node.attrib:
-        accu_sigh.add(node.attrib["handler"])
-    for child in node:
-        collect_widgets(child, accu_wdgs, accu_sigh)
-    return accu_wdgs, accu_sigh
+
+def remove_init_return(
+    t: ControllerToWidgetTransformer, node: FunctionDef
+) -> RuleResult:
+    """Removes the return at the end of __init__ (which returned the view)."""
+    if (
+        node.name != "__init__"
+        or not isinstance(node.body[-1], ast.Return)
+        or not t.is_controller_method(node)
+    ):
+        return NOT_APPLIED
+    t.remove(node.body.pop())
+    return node
+
+
+def remove_builder_asserts(
+    t: ControllerToWidgetTransformer, node: ast.Assert
+) -> RuleResult:
+    """Removes assert self.builder."""
+    match node.test:
+        case ast.Attribute(value=ast.Name(id="self"), attr="builder" | "_builder"):
+            return t.remove(node)
+    return NOT_APPLIED
+
+
+def remove_builder_assignments(
+    t: ControllerToWidgetTransformer, node: Union[ast.Assign, ast.AnnAssign]
+) -> RuleResult:
+    """Removes assignments to self.builder and of self._get_builder()."""
+    targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+    if len(targets) == 1:
+        match targets[0]:
+            case ast.Attribute(value=ast.Name(id="self"), attr="builder" | "_builder"):
+                return t.remove(node)
+    match node.value:
+        case ast.Call(
+            func=ast.Attribute(value=ast.Name(id="self"), attr="_get_builder")
+        ):
+            return t.remove(node)
+    return NOT_APPLIED
 
 
-def transform_widget_ast(
-    controller_ast: ast.AST, glade_tree: ElementTree, info: CollectInfoEntry
-) -> ast.AST:
-    widgets, signal_handlers = collect_widgets(glade_tree.getroot())
-    del widgets[info.main_widget_name]
-    v = ControllerToWidgetTransformer(info, widgets, signal_handlers)
-    return v.visit(controller_ast)
+def remove_empty_expressions(
+    t: ControllerToWidgetTransformer, node: ast.Expr
+) -> RuleResult:
+    """Removes expression statements whose expression was removed by another rule."""
+    if hasattr(node, "value"):
+        return NOT_APPLIED
+    return t.remove(node)
 
 
-def transform_ui_tree(glade_tree: ElementTree, info: CollectInfoEntry):
-    for node in glade_tree.getroot():
-        # We search only on the top level, since it really has to be there.
-        if (
-            node.tag == "object"
-            and node.attrib.get("id", None) == info.main_widget_name
+def remove_connect_signals(t: ControllerToWidgetTransformer, node: Call) -> RuleResult:
+    """Removes self.builder.connect_signals(...)."""
+    match node.func:
+        case ast.Attribute(
+            value=ast.Attribute(value=ast.Name(id="self"), attr="builder" | "_builder"),
+            attr="connect_signals",
         ):
-            node.tag = "template"
-            del node.attrib["id"]
-            node.attrib["class"] = assert_not_none(info.new_widget_name)
-            node.attrib["parent"] = assert_not_none(info.main_widget_type).replace(
-                ".", ""
-            )
-            return
-    raise ValueError("Did not find main widget to convert to template.")
+            return None
+    return NOT_APPLIED
+
+
+def replace_builder_get_assert(
+    t: ControllerToWidgetTransformer, node: Call
+) -> RuleResult:
+    """Replaces builder_get_assert([self.]builder, <TY>, <NAME>) with self.<NAME>."""
+    match node.func:
+        case ast.Name(id="builder_get_assert"):
+            pass
+        case _:
+            return NOT_APPLIED
+    match node.args[2]:
+        case ast.Constant(value=widget_name):
+            pass
+        case ast.JoinedStr(values) if len(values) == 1:
+            assert isinstance(values[0], ast.Constant)
+            widget_name = values[0].value
+        case ast.JoinedStr() | ast.Name():
+            if t.patch is not None:
+                t.patch.replace(node, f"getattr(self, {t.patch.segment(node.args[2])})")
+            return SELF_GETATTR.expr(NAME=node.args[2])
+        case other:
+            raise AssertionError(other)
+    name = str(widget_name)
+    name = t.widget_renames.get(name, name)
+    if t.patch is not None:
+        t.patch.replace(node, f"self.{name}")
+    return SELF_ATTR.expr(NAME=name)
+
+
+RULES: Tuple[Rule, ...] = (
+    Rule("fix_imports", (Module,), fix_imports, required=True),
+    Rule("skip_other_classes", (ClassDef,), skip_other_classes),
+    Rule("add_template_decorator", (ClassDef,), add_template_decorator, required=True),
+    Rule("change_class", (ClassDef,), change_class, required=True),
+    Rule("add_gtype_name", (ClassDef,), add_gtype_name, required=True),
+    Rule("add_module_attributes", (ClassDef,), add_module_attributes, required=True),
+    Rule("add_child_widgets", (ClassDef,), add_child_widgets, required=True),
+    Rule("merge_init_get_view", (ClassDef,), merge_init_get_view, required=True),
+    Rule("add_template_callbacks", (FunctionDef,), add_template_callbacks),
+    Rule("init_super", (FunctionDef,), init_super, required=True),
+    Rule("remove_init_return", (FunctionDef,), remove_init_return),
+    Rule("remove_builder_asserts", (ast.Assert,), remove_builder_asserts),
+    Rule(
+        "remove_builder_assignments",
+        (ast.Assign, ast.AnnAssign),
+        remove_builder_assignments,
+    ),
+    Rule(
+        "remove_empty_expressions",
+        (ast.Expr,),
+        remove_empty_expressions,
+        after_children=True,
+    ),
+    Rule("remove_connect_signals", (Call,), remove_connect_signals),
+    Rule("replace_builder_get_assert", (Call,), replace_builder_get_assert),
+)
+# Names of the rules that can be disabled.
+OPTIONAL_RULE_NAMES: Tuple[str, ...] = tuple(x.name for x in RULES if not x.required)
+
+
+def _is_inline_comment(node: ast.stmt) -> bool:
+    return isinstance(node, ast_comments.Comment) and node.inline
+
+
+def _statements(body: List[ast.stmt]) -> List[ast.stmt]:
+    """
+    The body without a comment on the line that opens it, which the parser puts in
+    front of it.
+    """
+    if len(body) > 1 and _is_inline_comment(body[0]):
+        return body[1:]
+    return body
 
 
-def stmt(stmt: str) -> ast.stmt:
-    return ast.parse(
-        stmt,
-        mode="single",
-    ).body[0]
+def _has_single_line_suite(node: ast.AST) -> bool:
+    """Whether a compound statement in node has its body on the line of its header."""
+    for child in ast.iter_child_nodes(node):
+        if not isinstance(child, (ast.stmt, ast.ExceptHandler)):
+            continue
+        body = _statements(getattr(child, "body", []))
+        if len(body) > 0 and body[0].lineno == child.lineno:
+            return True
+        if _has_single_line_suite(child):
+            return True
+    return False
 
 
-def expr(expr: str) -> ast.expr:
-    return assert_is(ast.Expr, stmt(expr)).value
+def transform_widget_ast(
+    controller_ast: ast.AST,
+    glade_index: GladeIndex,
+    info: CollectInfoEntry,
+    patch: Optional[SourcePatch] = None,
+    rules: Optional[Sequence[Rule]] = None,
+) -> ast.AST:
+    """
+    If patch is given, the changes are also recorded in it. rules default to RULES.
+    If profiling is enabled, every rule is timed and recorded as a section.
+    """
+    widgets = glade_index.widgets()
+    del widgets[assert_not_none(info.main_widget_name)]
+    v = ControllerToWidgetTransformer(
+        info,
+        widgets,
+        glade_index.signal_handlers,
+        patch,
+        rules,
+        timed=profiling.enabled(),
+    )
+    widget_ast = v.visit(controller_ast)
+    if profiling.enabled():
+        v.record_profile()
+    v.assert_done()
+    return widget_ast
+
+
+def transform_ui_source(glade_source: bytes, info: CollectInfoEntry) -> bytes:
+    """Turns the main widget into the template. Everything else is kept byte for byte."""
+    return rewrite_template(
+        glade_source,
+        assert_not_none(info.main_widget_name),
+        assert_not_none(info.new_widget_name),
+        assert_not_none(info.main_widget_type).replace(".", ""),
+    )
+
+
+def transform_ui_tree(glade_index: GladeIndex, info: CollectInfoEntry):
+    """
+    Same as transform_ui_source, on the parsed glade file, which has to be serialized
+    again afterwards. Only used to verify transform_ui_source.
+    """
+    # We search only on the top level, since it really has to be there.
+    node = glade_index.top_level_object(assert_not_none(info.main_widget_name))
+    if node is None:
+        raise ValueError("Did not find main widget to convert to template.")
+    node.tag = "template"
+    del node.attrib["id"]
+    node.attrib["class"] = assert_not_none(info.new_widget_name)
+    node.attrib["parent"] = assert_not_none(info.main_widget_type).replace(".", "")
@@ -0,0 +1,177 @@
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Optional, List, Dict, Tuple, Iterator, ContextManager
+
+from skytemple_view_migration.output import p_info
+
+# Stack of section names -> [count, wall time, cpu time]
+ProfileRecords = Dict[Tuple[str, ...], List[float]]
+
+_NO_SECTION = nullcontext()
+# Section that merged records are put below. They were timed concurrently with the
+# section they are merged into, so they are not part of its own time.
+WORKERS = "workers"
+
+
+class Profiler:
+    records: ProfileRecords
+    _stack: List[str]
+
+    def __init__(self):
+        self.records = {}
+        self._stack = []
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        self._stack.append(name)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            record = self.records.setdefault(tuple(self._stack), [0, 0.0, 0.0])
+            record[0] += 1
+            record[1] += time.perf_counter() - start_wall
+            record[2] += time.process_time() - start_cpu
+            self._stack.pop()
+
+    def merge(self, records: ProfileRecords):
+        """
+        Merges records collected elsewhere (e.g. in a worker) below the WORKERS section
+        of the current section.
+        """
+        prefix = tuple(self._stack) + (WORKERS,)
+        for stack, (count, wall, cpu) in records.items():
+            record = self.records.setdefault(prefix + stack, [0, 0.0, 0.0])
+            record[0] += count
+            record[1] += wall
+            record[2] += cpu
+
+    def record(self, name: str, count: int, wall: float, cpu: float):
+        """Adds a section that was timed elsewhere, below the current section."""
+        record = self.records.setdefault(tuple(self._stack) + (name,), [0, 0.0, 0.0])
+        record[0] += count
+        record[1] += wall
+        record[2] += cpu
+
+    def self_times(self) -> Dict[Tuple[str, ...], Tuple[float, float]]:
+        """
+        Wall and cpu time spent in each section itself, without its sub-sections.
+        WORKERS sections have no record, so merged records are never subtracted.
+        """
+        result = {stack: (wall, cpu) for stack, (_, wall, cpu) in self.records.items()}
+        for stack, (_, wall, cpu) in self.records.items():
+            parent = stack[:-1]
+            if parent in result:
+                p_wall, p_cpu = result[parent]
+                result[parent] = (p_wall - wall, p_cpu - cpu)
+        return result
+
+    def dump(self, path: str):
+        """
+        Writes the report as JSON to path and in the folded stack format of
+        flamegraph.pl / speedscope (self wall time in microseconds) to path.folded.
+        """
+        self_times = self.self_times()
+        with open(path, "w") as f:
+            json.dump(
+                [
+                    {
+                        "stack": list(stack),
+                        "count": count,
+                        "wall": wall,
+                        "cpu": cpu,
+                        "self_wall": self_times[stack][0],
+                        "self_cpu": self_times[stack][1],
+                    }
+                    for stack, (count, wall, cpu) in self.records.items()
+                ],
+                f,
+                indent=2,
+            )
+        with open(f"{path}.folded", "w") as f:
+            for stack, (self_wall, _) in self_times.items():
+                f.write(f"{';'.join(stack)} {max(0, round(self_wall * 1e6))}\n")
+
+    def print_top(self, n: int = 10):
+        by_name: Dict[str, List[float]] = {}
+        for stack, (self_wall, self_cpu) in self.self_times().items():
+            record = by_name.setdefault(stack[-1], [0.0, 0.0])
+            record[0] += self_wall
+            record[1] += self_cpu
+        # Merged records ran in parallel, so they can add up to more than 100%.
+        total = (
+            sum(wall for stack, (_, wall, _) in self.records.items() if len(stack) == 1)
+            or 1.0
+        )
+        p_info(f"Top {n} sections by own wall time (% of the total wall time):")
+        for name, (wall, cpu) in sorted(by_name.items(), key=lambda x: -x[1][0])[:n]:
+            p_info(
+                f"  {name:<32} wall {wall:8.3f}s ({wall / total:6.1%})  cpu {cpu:8.3f}s"
+            )
+
+
+_profiler: Optional[Profiler] = None
+# Profilers of capture(), per thread. Other threads than the main thread must only
+# use sections within capture().
+_captured = threading.local()
+
+
+def _current() -> Optional[Profiler]:
+    return getattr(_captured, "profiler", None) or _profiler
+
+
+def enable() -> Profiler:
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def enabled() -> bool:
+    return _profiler is not None
+
+
+def section(name: str) -> ContextManager[None]:
+    """Times the enclosed block, if profiling is enabled."""
+    profiler = _current()
+    if profiler is None:
+        return _NO_SECTION
+    return profiler.section(name)
+
+
+def record(name: str, count: int, wall: float, cpu: float):
+    """Adds a section that was timed elsewhere, if profiling is enabled."""
+    profiler = _current()
+    if profiler is not None:
+        profiler.record(name, count, wall, cpu)
+
+
+@contextmanager
+def capture() -> Iterator[Optional[ProfileRecords]]:
+    """
+    Collects the records of the enclosed block separately, so they can be sent from
+    a worker process or thread and merged into the main profiler in order.
+    Only affects the current thread. Yields None if profiling is disabled.
+    """
+    if _profiler is None:
+        yield None
+        return
+    previous = getattr(_captured, "profiler", None)
+    _captured.profiler = Profiler()
+    try:
+        yield _captured.profiler.records
+    finally:
+        _captured.profiler = previous
+
+
+def merge(records: Optional[ProfileRecords]):
+    profiler = _current()
+    if profiler is not None and records is not None:
+        profiler.merge(records)
+
+
+def init_worker(enable_profiling: bool):
+    if enable_profiling:
+        enable()
@@ -0,0 +1,149 @@
+import ast
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+
+from skytemple_view_migration import profiling
+
+
+class Outcome(Enum):
+    # The rule does not apply to the node.
+    NOT_APPLIED = 0
+    # The node stays as it is. No further rules run on it or on its children.
+    KEEP = 1
+
+
+NOT_APPLIED = Outcome.NOT_APPLIED
+KEEP = Outcome.KEEP
+
+# What a rule returns: An Outcome, the node itself (possibly changed, the next rules run
+# on it), a new node (only its children are visited) or None to remove the node.
+RuleResult = Union[ast.AST, None, Outcome]
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    node_types: Tuple[Type[ast.AST], ...]
+    # (transformer, node) -> result. The transformer holds the state of the run.
+    apply: Callable[[Any, Any], RuleResult]
+    # Runs after the children of the node were visited, instead of before.
+    after_children: bool = False
+    # The transformation fails if the rule never applied.
+    required: bool = False
+
+    @property
+    def description(self) -> str:
+        return (self.apply.__doc__ or "").strip()
+
+
+@dataclass(slots=True)
+class RuleStats:
+    # How often the rule applied (did not return NOT_APPLIED).
+    fired: int = 0
+    # Time spent in the rule, if timed. Not including the visits of children.
+    wall: float = 0.0
+    cpu: float = 0.0
+
+
+class RuleTransformer(ast.NodeTransformer):
+    """
+    Runs rules on every node of a tree in one traversal. The rules for a node are looked
+    up by its type, so rules for other node types do not cost anything.
+    Rules run in the order they are given.
+    """
+
+    rules: Sequence[Rule]
+    stats: Dict[str, RuleStats]
+    _before: Dict[type, List[Tuple[Rule, RuleStats]]]
+    _after: Dict[type, List[Tuple[Rule, RuleStats]]]
+    _timed: bool
+
+    def __init__(self, rules: Sequence[Rule], timed: bool = False):
+        self.rules = rules
+        self.stats = {}
+        self._before = {}
+        self._after = {}
+        self._timed = timed
+        for rule in rules:
+            stats = self.stats.setdefault(rule.name, RuleStats())
+            table = self._after if rule.after_children else self._before
+            for node_type in rule.node_types:
+                table.setdefault(node_type, []).append((rule, stats))
+
+    def visit(self, node: ast.AST) -> Any:
+        before = self._before.get(type(node))
+        if before is not None:
+            for rule, stats in before:
+                result = self._apply(rule, stats, node)
+                if result is node or result is NOT_APPLIED:
+                    continue
+                if isinstance(result, Outcome):
+                    return node
+                if result is None:
+                    return None
+                return self.generic_visit(result)
+
+        node = self.generic_visit(node)
+
+        after = self._after.get(type(node))
+        if after is not None:
+            for rule, stats in after:
+                result = self._apply(rule, stats, node)
+                if result is node or result is NOT_APPLIED:
+                    continue
+                if isinstance(result, Outcome):
+                    return node
+                return result
+        return node
+
+    def assert_done(self):
+        """Fails if a required rule never applied."""
+        for rule in self.rules:
+            if rule.required and self.stats[rule.name].fired < 1:
+                raise AssertionError(f"Did not {rule.name}")
+
+    def record_profile(self):
+        """Adds the stats of the rules to the current profiling section."""
+        for name, stats in self.stats.items():
+            profiling.record(f"rule {name}", stats.fired, stats.wall, stats.cpu)
+
+    def _apply(self, rule: Rule, stats: RuleStats, node: ast.AST) -> RuleResult:
+        if self._timed:
+            start_wall = time.perf_counter()
+            start_cpu = time.process_time()
+            result = rule.apply(self, node)
+            stats.wall += time.perf_counter() - start_wall
+            stats.cpu += time.process_time() - start_cpu
+        else:
+            result = rule.apply(self, node)
+        if result is not NOT_APPLIED:
+            stats.fired += 1
+        return result
+
+
+def select_rules(
+    rules: Sequence[Rule], disabled: Optional[Collection[str]] = None
+) -> List[Rule]:
+    """The rules that are not disabled (by name). Required rules can not be disabled."""
+    if not disabled:
+        return list(rules)
+    unknown = set(disabled) - {x.name for x in rules}
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown rules: {', '.join(sorted(unknown))}")
+    required = [x.name for x in rules if x.required and x.name in disabled]
+    if len(required) > 0:
+        raise ValueError(f"Rules can not be disabled: {', '.join(required)}")
+    return [x for x in rules if x.name not in disabled]
@@ -0,0 +1,113 @@
+import ast
+import json
+import re
+from functools import lru_cache
+from typing import Dict, Union, FrozenSet, Optional
+
+from skytemple_view_migration.util import assert_is, is_identifier
+
+SnippetValue = Union[str, ast.expr]
+
+_LOAD = ast.Load()
+_STORE = ast.Store()
+
+
+class Snippet:
+    """
+    A statement that is parsed only once and can then be instantiated many times.
+
+    Placeholders are names given to the constructor. In the source they can be used as:
+    - a name (`NAME`): replaced by an expression, either given as node or as source string.
+    - a string constant (`"NAME"`): replaced by a string constant.
+    - an attribute name (`self.NAME`): replaced by the given attribute name.
+    """
+
+    _node: ast.stmt
+    _placeholders: FrozenSet[str]
+    _source: str
+    _pattern: Optional["re.Pattern[str]"]
+
+    def __init__(self, source: str, *placeholders: str):
+        self._node = ast.parse(source).body[0]
+        self._placeholders = frozenset(placeholders)
+        self._source = source
+        self._pattern = None
+        if len(placeholders) > 0:
+            names = sorted(placeholders, key=len, reverse=True)
+            self._pattern = re.compile("|".join(rf'"{x}"|\b{x}\b' for x in names))
+
+    def stmt(self, **values: SnippetValue) -> ast.stmt:
+        assert values.keys() == self._placeholders
+        return _fill(self._node, values)
+
+    def expr(self, **values: SnippetValue) -> ast.expr:
+        return assert_is(ast.Expr, self.stmt(**values)).value
+
+    def source(self, **values: SnippetValue) -> str:
+        """
+        The statement as source, without building it. String constants are double
+        quoted, other values are inserted as they are given (nodes are unparsed).
+        """
+        assert values.keys() == self._placeholders
+        if self._pattern is None:
+            return self._source
+
+        def replace(match: "re.Match[str]") -> str:
+            text = match.group(0)
+            if text.startswith('"'):
+                # JSON strings are valid Python strings, in the quotes of the snippets.
+                return json.dumps(
+                    assert_is(str, values[text[1:-1]]), ensure_ascii=False
+                )
+            value = values[text]
+            return value if isinstance(value, str) else ast.unparse(value)
+
+        return self._pattern.sub(replace, self._source)
+
+
+def expression(source: str) -> ast.expr:
+    """Returns a fresh node for an expression. Dotted names are built without parsing."""
+    parts = source.split(".")
+    if all(is_identifier(x) for x in parts):
+        node: ast.expr = ast.Name(id=parts[0], ctx=_LOAD)
+        for part in parts[1:]:
+            node = ast.Attribute(value=node, attr=part, ctx=_LOAD)
+        return node
+    return _fill(_parse_expression(source), {})
+
+
+@lru_cache(maxsize=256)
+def _parse_expression(source: str) -> ast.expr:
+    return ast.parse(source, mode="eval").body
+
+
+def _fill(node, values: Dict[str, SnippetValue]):
+    cls = node.__class__
+    if cls is ast.Name and node.id in values:
+        replacement = values[node.id]
+        if not isinstance(replacement, str):
+            return _fill(replacement, {})
+        if isinstance(node.ctx, ast.Store):
+            if not is_identifier(replacement):
+                raise ValueError(f"'{replacement}' is not a valid identifier.")
+            return ast.Name(id=replacement, ctx=_STORE)
+        return expression(replacement)
+    if cls is ast.Constant and isinstance(node.value, str) and node.value in values:
+        return ast.Constant(value=assert_is(str, values[node.value]))
+
+    new = cls.__new__(cls)
+    for name in node._fields:
+        value = getattr(node, name, None)
+        if value.__class__ is list:
+            value = [_fill(x, values) if isinstance(x, ast.AST) else x for x in value]
+        elif isinstance(value, ast.expr_context):
+            pass  # these are shared by the parser too.
+        elif isinstance(value, ast.AST):
+            value = _fill(value, values)
+        elif cls is ast.Attribute and name == "attr" and value in values:
+            value = assert_is(str, values[value])
+        setattr(new, name, value)
+    for name in node._attributes:
+        if hasattr(node, name):
+            setattr(new, name, getattr(node, name))
+    return new
@@ -1,6 +1,13 @@
+import re
 from dataclasses import dataclass
-from typing import Optional
-from xml.etree.ElementTree import Element
+from io import BytesIO
+from typing import Optional, Dict, List, Set, Tuple, Union, BinaryIO
+from xml.etree.ElementTree import Element, iterparse
+from xml.parsers import expat
+from xml.sax.saxutils import quoteattr
+
+# Path to a glade file or the content of one.
+GladeSource = Union[str, bytes]
 
 
 @dataclass
@@ -20,11 +27,190 @@ class BuilderObject:
             raise KeyError(self.gtk_class)
 
 
-def find_object(node: Element, id_name: str) -> Optional[BuilderObject]:
-    if node.tag == "object" and node.attrib.get("id", None) == id_name:
-        return BuilderObject(node.attrib.get("id", None), node.attrib["class"])
-    for child in node:
-        ret = find_object(child, id_name)
-        if ret is not None:
-            return ret
+@dataclass
+class GladeIndex:
+    """
+    Index over a glade document, built in one iterative pass.
+    Objects are indexed by id, in document order. If an id is used more than once,
+    the first object wins.
+    """
+
+    root: Element
+    elements: Dict[str, Element]
+    parents: Dict[str, Element]
+    signal_handlers: Set[str]
+    # GTK class of every object with an id and a class.
+    gtk_classes: Dict[str, str]
+
+    def __init__(self, root: Element):
+        self.root = root
+        self.elements = {}
+        self.parents = {}
+        self.signal_handlers = set()
+        self.gtk_classes = {}
+
+        stack: List[Tuple[Element, Optional[Element]]] = [(root, None)]
+        while len(stack) > 0:
+            node, parent = stack.pop()
+            if node.tag == "object":
+                id_name = node.attrib.get("id", None)
+                if id_name is not None:
+                    if id_name not in self.elements:
+                        self.elements[id_name] = node
+                        if parent is not None:
+                            self.parents[id_name] = parent
+                    if "class" in node.attrib:
+                        self.gtk_classes[id_name] = node.attrib["class"]
+            elif node.tag == "signal" and "handler" in node.attrib:
+                self.signal_handlers.add(node.attrib["handler"])
+            stack.extend((child, node) for child in reversed(node))
+
+    def top_level_object(self, id_name: str) -> Optional[Element]:
+        node = self.elements.get(id_name, None)
+        if node is None or self.parents.get(id_name, None) is not self.root:
+            return None
+        return node
+
+    def widgets(self) -> Dict[str, str]:
+        """Python classes of all objects with an id and a class."""
+        return {
+            id_name: BuilderObject(None, gtk_class).py_class
+            for id_name, gtk_class in self.gtk_classes.items()
+        }
+
+
+def scan_glade_object(glade: GladeSource, id_name: str) -> Optional[BuilderObject]:
+    """
+    Streams the glade file only until the object with the given id is found,
+    without keeping the parsed document in memory.
+    """
+    with _open_glade(glade) as f:
+        for event, node in iterparse(f, events=("start", "end")):
+            if event == "start":
+                if node.tag == "object" and node.attrib.get("id", None) == id_name:
+                    return BuilderObject(id_name, node.attrib["class"])
+            else:
+                node.clear()
     return None
+
+
+def scan_glade_top_level(glade: GladeSource) -> List[Tuple[str, str]]:
+    """
+    Streams the glade file and returns id and GTK class of all top-level objects with
+    both, in document order.
+    """
+    objects = []
+    depth = 0
+    with _open_glade(glade) as f:
+        for event, node in iterparse(f, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 2 and node.tag == "object":
+                    id_name = node.attrib.get("id", None)
+                    gtk_class = node.attrib.get("class", None)
+                    if id_name is not None and gtk_class is not None:
+                        objects.append((id_name, gtk_class))
+            else:
+                depth -= 1
+                node.clear()
+    return objects
+
+
+def _open_glade(glade: GladeSource) -> BinaryIO:
+    if isinstance(glade, bytes):
+        return BytesIO(glade)
+    return open(glade, "rb")
+
+
+def rewrite_template(
+    glade_source: bytes, id_name: str, class_name: str, parent: str
+) -> bytes:
+    """
+    Turns the top-level object with the given id into a template of class_name with the
+    given parent class. Only the start and end tag of the object are changed, all other
+    bytes of the document are kept as they are.
+    """
+    start, end = _find_top_level_object(glade_source, id_name)
+    start_tag_end = _tag_end(glade_source, start)
+    start_tag = glade_source[start:start_tag_end].decode("utf-8")
+    self_closing = start_tag.endswith("/>")
+
+    attributes = []
+    has_parent = False
+    for match in _ATTRIBUTE.finditer(start_tag):
+        space, name, equals, value = match.groups()
+        if name == "id":
+            continue
+        if name == "class":
+            value = quoteattr(class_name)
+        elif name == "parent":
+            value = quoteattr(parent)
+            has_parent = True
+        attributes.append(f"{space}{name}{equals}{value}")
+    if not has_parent:
+        attributes.append(f" parent={quoteattr(parent)}")
+    # Keep whatever whitespace there is before the tag closes.
+    closing = _TAG_CLOSE.search(start_tag)
+    new_start_tag = (
+        "<template"
+        + "".join(attributes)
+        + (closing.group(0) if closing is not None else ">")
+    ).encode("utf-8")
+
+    if self_closing:
+        return glade_source[:start] + new_start_tag + glade_source[start_tag_end:]
+    end_tag_end = _tag_end(glade_source, end)
+    return (
+        glade_source[:start]
+        + new_start_tag
+        + glade_source[start_tag_end:end]
+        + b"</template>"
+        + glade_source[end_tag_end:]
+    )
+
+
+_ATTRIBUTE = re.compile(r"""(\s+)([^\s=/>]+)(\s*=\s*)("[^"]*"|'[^']*')""")
+_TAG_CLOSE = re.compile(r"\s*/?>$")
+
+
+def _find_top_level_object(glade_source: bytes, id_name: str) -> Tuple[int, int]:
+    """Byte offsets of the start of the start tag and end tag of the object."""
+    parser = expat.ParserCreate()
+    depth = 0
+    found_depth = -1
+    start = end = -1
+
+    def start_element(name: str, attrs: Dict[str, str]):
+        nonlocal depth, found_depth, start
+        depth += 1
+        if depth == 2 and start < 0 and name == "object" and attrs.get("id") == id_name:
+            start = parser.CurrentByteIndex
+            found_depth = depth
+
+    def end_element(name: str):
+        nonlocal depth, end
+        if depth == found_depth and end < 0:
+            end = parser.CurrentByteIndex
+        depth -= 1
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.Parse(glade_source, True)
+    if start < 0 or end < 0:
+        raise ValueError("Did not find main widget to convert to template.")
+    return start, end
+
+
+def _tag_end(source: bytes, start: int) -> int:
+    """Offset after the end of the tag starting at start, '>' in attribute values are skipped."""
+    quote = None
+    for i in range(start, len(source)):
+        c = source[i]
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c == 0x22 or c == 0x27:  # " or '
+            quote = c
+        elif c == 0x3E:  # >
+            return i + 1
+    raise ValueError("Unterminated tag.")
@@ -1,4 +1,6 @@
 import ast
+import hashlib
+import keyword
 from typing import Type, Any, TypeVar, Optional
 
 T = TypeVar("T")
@@ -21,6 +23,11 @@ def camel_case(input_string: str) -> str:
     return camel_case_string[0].lower() + camel_case_string[1:]
 
 
+def is_identifier(name: str) -> bool:
+    """Whether name can be used as a variable or attribute name."""
+    return name.isidentifier() and not keyword.iskeyword(name)
+
+
 def parse_annotation(annotation: Optional[ast.AST]):
     match annotation:
         case ast.Name(id=name):
@@ -31,3 +38,16 @@ def parse_annotation(annotation: Optional[ast.AST]):
             pass
         case other:
             raise ValueError(f"Unexpected annotation type: {type(other)}")
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path: str) -> Optional[str]:
+    """Returns the content hash of the file at path, or None if it does not exist."""
+    try:
+        with open(path, "rb") as f:
+            return content_hash(f.read())
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,252 @@
+"""
+Checks generated widgets statically, without importing them or starting GTK. Every
+check looks at the widget module and its UI template only.
+"""
+
+import ast
+import os
+from dataclasses import dataclass
+from functools import partial
+from typing import Optional, Collection, List, Set, Dict, Union
+from xml.etree.ElementTree import ParseError
+
+from skytemple_view_migration.cache import ParseCache, parse_glade_source
+from skytemple_view_migration.collect_info import CollectInfo, CollectInfoEntry
+from skytemple_view_migration.output import p_info, p_warn
+from skytemple_view_migration.parallel import map_pipelined
+from skytemple_view_migration.phase_one import missing_fields
+from skytemple_view_migration.phase_two import output_paths
+from skytemple_view_migration.ui_xml import GladeIndex
+from skytemple_view_migration.util import content_hash, assert_not_none
+from skytemple_view_migration.writer import OutputWriter
+
+BUILDER_ATTRIBUTES = ("builder", "_builder")
+# Part of the cache key of verification results. Must be changed when the checks change.
+CHECKS_VERSION = b"1"
+
+
+def run_verify(
+    skytemple_directory: str,
+    collect_info: CollectInfo,
+    jobs: int = 1,
+    cache: Optional[ParseCache] = None,
+    writer: Optional[OutputWriter] = None,
+    modules: Optional[Collection[str]] = None,
+) -> int:
+    """
+    Verifies the outputs of all generated widgets, as they are after the next commit
+    of writer. Reports all problems and returns the number of widgets with problems.
+    """
+    p_info("Verifying widgets.")
+    sd_abs = os.path.abspath(skytemple_directory)
+    if writer is None:
+        writer = OutputWriter()
+    entries = [
+        entry
+        for entry in collect_info.entries.values()
+        if len(missing_fields(entry)) < 1
+        and entry.widget_hash is not None
+        and (modules is None or entry.module_name in modules)
+    ]
+    failed = 0
+    for entry, problems in zip(
+        entries,
+        map_pipelined(
+            partial(read_outputs, sd_abs, writer),
+            partial(verify_outputs, cache=cache),
+            entries,
+            jobs,
+        ),
+    ):
+        if len(problems) > 0:
+            failed += 1
+        for problem in problems:
+            p_warn(f"{entry.module_name}/{entry.controller_name}: {problem}")
+    p_info(f"Verified {len(entries)} widgets, {failed} with problems.")
+    return failed
+
+
+@dataclass
+class WidgetOutputs:
+    widget_path: str
+    widget_source: Optional[bytes]
+    ui_source: Optional[bytes]
+
+
+def read_outputs(
+    sd_abs: str, writer: OutputWriter, entry: CollectInfoEntry
+) -> WidgetOutputs:
+    """Reads the outputs of an entry. Safe to run in a thread."""
+    widget_path, ui_path = output_paths(sd_abs, entry)
+    return WidgetOutputs(widget_path, writer.read(widget_path), writer.read(ui_path))
+
+
+def verify_outputs(
+    outputs: WidgetOutputs, cache: Optional[ParseCache] = None
+) -> List[str]:
+    """Safe to run in a worker process."""
+    if outputs.widget_source is None:
+        return ["The widget module does not exist."]
+    if outputs.ui_source is None:
+        return ["The UI template does not exist."]
+    widget_source = outputs.widget_source
+    ui_source = outputs.ui_source
+    verify = partial(verify_widget, widget_source, ui_source, outputs.widget_path)
+    if cache is None:
+        return verify()
+    key = b"%s:%d:" % (CHECKS_VERSION, len(widget_source)) + widget_source + ui_source
+    return cache.verification(content_hash(key), verify)
+
+
+def verify_widget(
+    widget_source: bytes, ui_source: bytes, filename: str = "<widget>"
+) -> List[str]:
+    """
+    The problems of a widget module and its UI template, empty if there are none:
+    The module must compile, its template class must be the one of the template, its
+    template children must be objects of it, its signal handlers must be template
+    callbacks and no builder references may be left.
+    """
+    try:
+        widget_ast = ast.parse(widget_source, filename)
+        compile(widget_ast, filename, "exec")
+    except (SyntaxError, ValueError) as e:
+        return [f"The widget module does not compile: {e}"]
+    try:
+        ui_root = assert_not_none(parse_glade_source(ui_source).getroot())
+    except ParseError as e:
+        return [f"The UI template is not valid XML: {e}"]
+
+    problems = []
+    widget = TemplateVisitor()
+    widget.visit(widget_ast)
+    template = ui_root.find("template")
+    if widget.gtype_name is None:
+        problems.append("No Gtk.Template class with a __gtype_name__ found.")
+    if template is None:
+        problems.append("The UI file has no template.")
+    elif widget.gtype_name is not None and template.get("class") != widget.gtype_name:
+        problems.append(
+            f"The template class {template.get('class')} is not the "
+            f"__gtype_name__ {widget.gtype_name}."
+        )
+
+    ui = GladeIndex(ui_root)
+    for name, lineno in widget.children.items():
+        if name not in ui.elements:
+            problems.append(
+                f"Template child {name} (line {lineno}) is not an object of the UI file."
+            )
+    for handler in sorted(ui.signal_handlers - widget.callbacks):
+        problems.append(f"Signal handler {handler} has no template callback.")
+    for lineno in widget.builder_references:
+        problems.append(f"Builder reference left in line {lineno}.")
+    return problems
+
+
+class TemplateVisitor(ast.NodeVisitor):
+    """
+    Collects the __gtype_name__, template children (by id) and template callbacks
+    (by handler name) of the first Gtk.Template class and all builder references.
+    """
+
+    gtype_name: Optional[str]
+    # Id -> line number
+    children: Dict[str, int]
+    callbacks: Set[str]
+    builder_references: List[int]
+    _template_class: Optional[ast.ClassDef]
+    _class: Optional[ast.ClassDef]
+
+    def __init__(self):
+        self.gtype_name = None
+        self.children = {}
+        self.callbacks = set()
+        self.builder_references = []
+        self._template_class = None
+        self._class = None
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        if self._template_class is None and any(
+            _call_name(x) == "Gtk.Template" for x in node.decorator_list
+        ):
+            self._template_class = node
+        previous = self._class
+        self._class = node
+        self.generic_visit(node)
+        self._class = previous
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        self._visit_function(node)
+
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef):
+        self._visit_function(node)
+
+    def visit_Assign(self, node: ast.Assign):
+        if self._in_template_class():
+            for target in node.targets:
+                self._class_attribute(target, node.value)
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign):
+        if self._in_template_class() and node.value is not None:
+            self._class_attribute(node.target, node.value)
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        match node:
+            case ast.Attribute(value=ast.Name(id="self"), attr=attr) if (
+                attr in BUILDER_ATTRIBUTES
+            ):
+                self.builder_references.append(node.lineno)
+        self.generic_visit(node)
+
+    def _in_template_class(self) -> bool:
+        return self._class is not None and self._class is self._template_class
+
+    def _visit_function(self, node: Union[ast.FunctionDef, ast.AsyncFunctionDef]):
+        if self._in_template_class():
+            for decorator in node.decorator_list:
+                if _call_name(decorator) == "Gtk.Template.Callback":
+                    self.callbacks.add(_name_argument(decorator) or node.name)
+        previous = self._class
+        self._class = None
+        self.generic_visit(node)
+        self._class = previous
+
+    def _class_attribute(self, target: ast.expr, value: ast.expr):
+        if not isinstance(target, ast.Name):
+            return
+        match value:
+            case ast.Constant(value=str(name)) if target.id == "__gtype_name__":
+                self.gtype_name = name
+                return
+        for node in ast.walk(value):
+            if _call_name(node) == "Gtk.Template.Child":
+                self.children[_name_argument(node) or target.id] = target.lineno
+
+
+def _call_name(node: ast.AST) -> Optional[str]:
+    """The dotted name of the function a call calls."""
+    if not isinstance(node, ast.Call):
+        return None
+    parts = []
+    func = node.func
+    while isinstance(func, ast.Attribute):
+        parts.append(func.attr)
+        func = func.value
+    if not isinstance(func, ast.Name):
+        return None
+    parts.append(func.id)
+    return ".".join(reversed(parts))
+
+
+def _name_argument(node: ast.AST) -> Optional[str]:
+    """The name given to a Gtk.Template.Child or Callback call, if any."""
+    if not isinstance(node, ast.Call):
+        return None
+    for arg in node.args[:1] + [x.value for x in node.keywords if x.arg == "name"]:
+        match arg:
+            case ast.Constant(value=str(name)):
+                return name
+    return None
@@ -0,0 +1,130 @@
+import os
+import time
+from typing import Optional, Collection, Mapping, Tuple, Dict, Sequence, List
+
+from skytemple_view_migration.cache import ParseCache
+from skytemple_view_migration.collect_info import CollectInfo
+from skytemple_view_migration.files import iter_controllers, GLADE_OVERRIDES
+from skytemple_view_migration.model import ControllerAndGlade
+from skytemple_view_migration.output import p_info, p_warn
+from skytemple_view_migration.phase_one import analyze_controllers, missing_fields
+from skytemple_view_migration.phase_two import generate_widgets
+from skytemple_view_migration.rules import Rule
+from skytemple_view_migration.writer import OutputWriter
+
+# (mtime, size) of the controller and of the glade file.
+ControllerStamp = Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]
+
+
+def watch(
+    skytemple_directory: str,
+    collect_info: CollectInfo,
+    jobs: int = 1,
+    cache: Optional[ParseCache] = None,
+    writer: Optional[OutputWriter] = None,
+    modules: Optional[Collection[str]] = None,
+    glade_overrides: Mapping[Tuple[str, str], str] = GLADE_OVERRIDES,
+    interval: float = 0.5,
+    generate: bool = True,
+    interactive: bool = True,
+    format_widgets: bool = False,
+    patch_widgets: bool = False,
+    rules: Optional[Sequence[Rule]] = None,
+):
+    """
+    Polls the controller directories and re-runs the Phase 1 analysis (and Phase 2
+    generation, if generate is set) for controllers whose controller or glade file
+    changed. Changed entries are saved to the journal of collect_info.
+    If a round fails, its writes are rolled back and the controllers are updated one by
+    one, the ones that fail are reported and skipped until they change again.
+    Runs until interrupted.
+    """
+    sd_abs = os.path.abspath(skytemple_directory)
+    if cache is None:
+        cache = ParseCache()
+
+    def update(controllers: List[ControllerAndGlade], round_jobs: int):
+        infos = analyze_controllers(
+            collect_info, controllers, round_jobs, cache, interactive
+        )
+        if generate:
+            complete = [x for x in infos if len(missing_fields(x)) < 1]
+            generate_widgets(
+                sd_abs,
+                collect_info,
+                complete,
+                round_jobs,
+                cache,
+                writer,
+                format_widgets,
+                patch_widgets,
+                rules,
+            )
+            if writer is not None:
+                writer.commit()
+
+    stamps = _scan(skytemple_directory, modules, glade_overrides)
+    p_info("Watching for changes. Press Ctrl-C to stop.")
+    try:
+        while True:
+            time.sleep(interval)
+            new_stamps = _scan(skytemple_directory, modules, glade_overrides)
+            changed = [
+                controller
+                for path, (controller, stamp) in new_stamps.items()
+                if path not in stamps or stamps[path][1] != stamp
+            ]
+            stamps = new_stamps
+            if len(changed) < 1:
+                continue
+
+            start = time.perf_counter()
+            # Starting a process pool is only worth it for larger batches of changes.
+            round_jobs = jobs if len(changed) >= jobs * 2 else 1
+            updated = len(changed)
+            try:
+                update(changed, round_jobs)
+            except Exception:
+                if writer is not None:
+                    writer.rollback()
+                updated = 0
+                for controller in changed:
+                    try:
+                        update([controller], 1)
+                        updated += 1
+                    except Exception as e:
+                        if writer is not None:
+                            writer.rollback()
+                        p_warn(
+                            f"Failed to update {controller.controller_path}, "
+                            f"skipped until it changes again: {e!r}"
+                        )
+            p_info(
+                f"Updated {updated} controllers in {time.perf_counter() - start:.3f}s."
+            )
+    except KeyboardInterrupt:
+        p_info("Stopped watching.")
+
+
+def _scan(
+    skytemple_directory: str,
+    modules: Optional[Collection[str]],
+    glade_overrides: Mapping[Tuple[str, str], str],
+) -> Dict[str, Tuple[ControllerAndGlade, ControllerStamp]]:
+    return {
+        controller.controller_path: (
+            controller,
+            (_stamp(controller.controller_path), _stamp(controller.glade_path)),
+        )
+        for controller in iter_controllers(
+            skytemple_directory, modules, glade_overrides
+        )
+    }
+
+
+def _stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,326 @@
+import difflib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Set
+
+from click import echo
+
+from skytemple_view_migration.output import p_info, p_warn
+
+# Name of the staging directory of StagingWriter in the SkyTemple directory.
+STAGING_DIR_NAME = ".view_migration_staging"
+
+
+class OutputWriter:
+    """
+    All changes Phase 2 and Phase 3 make to the SkyTemple directory go through this.
+    Files that already have the content to write and existing files to touch are left
+    alone, so their modification times (and caches depending on them) stay valid.
+    """
+
+    files_written: int
+    files_unchanged: int
+    files_new: int
+
+    def __init__(self):
+        self.files_written = 0
+        self.files_unchanged = 0
+        self.files_new = 0
+
+    def makedirs(self, path: str):
+        os.makedirs(path, exist_ok=True)
+
+    def touch(self, path: str):
+        if not os.path.exists(path):
+            Path(path).touch()
+
+    def write(self, path: str, content: bytes):
+        if self._needs_write(path, content):
+            with open(path, "wb") as f:
+                f.write(content)
+
+    def unlink(self, path: str):
+        os.unlink(path)
+
+    def read(self, path: str) -> Optional[bytes]:
+        """The content of a file as it is after the next commit, None if it will not exist."""
+        return _read(path)
+
+    def commit(self):
+        """Makes all changes so far visible, if they are not already."""
+        if self.files_written + self.files_unchanged + self.files_new > 0:
+            p_info(
+                f"Files: {self.files_written} written, {self.files_unchanged} unchanged, {self.files_new} new."
+            )
+        self.files_written = self.files_unchanged = self.files_new = 0
+
+    def rollback(self):
+        """Discards all changes since the last commit, if possible."""
+
+    def _needs_write(self, path: str, content: bytes) -> bool:
+        """Counts the write. False if the file already has this content: Same size first, then same bytes."""
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            self.files_new += 1
+            return True
+        if size == len(content) and _read(path) == content:
+            self.files_unchanged += 1
+            return False
+        self.files_written += 1
+        return True
+
+
+class StagingWriter(OutputWriter):
+    """
+    Writes all files into a staging directory first and applies all changes at once
+    on commit(), with os.replace renames. Replaced and deleted originals are moved into
+    the staging directory during the commit, so an interrupted commit can be rolled
+    back. The staging directory must be on the same file system as the outputs.
+
+    A manifest of all operations is written before the commit starts. If a staging
+    directory with a manifest is found when the writer is created, the last commit
+    was interrupted and is finished (if it got that far) or rolled back.
+    """
+
+    staging_dir: str
+    fsync: bool
+    _dirs: List[str]
+    # Output path -> staged file name, None to delete the output.
+    _operations: Dict[str, Optional[str]]
+    _staged_files: int
+
+    def __init__(self, staging_dir: str, fsync: bool = False):
+        super().__init__()
+        self.staging_dir = staging_dir
+        self.fsync = fsync
+        self._dirs = []
+        self._operations = {}
+        self._staged_files = 0
+        if os.path.exists(self._manifest_path):
+            self._recover()
+        elif os.path.exists(staging_dir):
+            shutil.rmtree(staging_dir)
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.staging_dir, "manifest.json")
+
+    def makedirs(self, path: str):
+        if path not in self._dirs:
+            self._dirs.append(path)
+
+    def touch(self, path: str):
+        if self._operations.get(path, None) is None and not os.path.exists(path):
+            self.write(path, b"")
+
+    def write(self, path: str, content: bytes):
+        staged = self._operations.get(path, None)
+        if not self._needs_write(path, content):
+            # Written before in this run, but now back to what is on disk.
+            if staged is not None:
+                os.unlink(os.path.join(self.staging_dir, staged))
+                del self._operations[path]
+            return
+        os.makedirs(self.staging_dir, exist_ok=True)
+        if staged is None:
+            staged = f"staged-{self._staged_files}"
+            self._staged_files += 1
+        with open(os.path.join(self.staging_dir, staged), "wb") as f:
+            f.write(content)
+        self._operations[path] = staged
+
+    def unlink(self, path: str):
+        staged = self._operations.get(path, None)
+        if staged is not None:
+            os.unlink(os.path.join(self.staging_dir, staged))
+        self._operations[path] = None
+
+    def read(self, path: str) -> Optional[bytes]:
+        if path not in self._operations:
+            return _read(path)
+        staged = self._operations[path]
+        if staged is None:
+            return None
+        return _read(os.path.join(self.staging_dir, staged))
+
+    def commit(self):
+        if len(self._operations) < 1:
+            self._clear()
+            super().commit()
+            return
+        if self.fsync:
+            for staged in self._operations.values():
+                if staged is not None:
+                    _fsync_file(os.path.join(self.staging_dir, staged))
+        operations: List[Dict[str, Any]] = [
+            {
+                "path": path,
+                "staged": staged,
+                "backup": f"backup-{i}" if os.path.exists(path) else None,
+            }
+            for i, (path, staged) in enumerate(self._operations.items())
+        ]
+        self._write_manifest({"operations": operations, "committed": False})
+
+        for directory in self._dirs:
+            os.makedirs(directory, exist_ok=True)
+        changed_dirs: Set[str] = set()
+        for op in operations:
+            path = op["path"]
+            if op["backup"] is not None:
+                os.replace(path, os.path.join(self.staging_dir, op["backup"]))
+            if op["staged"] is not None:
+                os.replace(os.path.join(self.staging_dir, op["staged"]), path)
+            changed_dirs.add(os.path.dirname(path))
+        if self.fsync:
+            for directory in changed_dirs:
+                _fsync_file(directory)
+
+        self._write_manifest({"operations": operations, "committed": True})
+        self._clear()
+        p_info(f"Committed {len(operations)} changes.")
+        super().commit()
+
+    def rollback(self):
+        if os.path.exists(self._manifest_path):
+            self._recover()
+        self._clear()
+
+    def _recover(self):
+        with open(self._manifest_path, "r") as f:
+            manifest = json.load(f)
+        operations = manifest["operations"]
+        if manifest["committed"]:
+            p_warn(
+                f"Cleaning up after the last completed commit in {self.staging_dir}."
+            )
+        else:
+            p_warn(f"Rolling back {len(operations)} changes of an interrupted commit.")
+            for op in reversed(operations):
+                path = op["path"]
+                if op["backup"] is not None:
+                    backup = os.path.join(self.staging_dir, op["backup"])
+                    if os.path.exists(backup):
+                        os.replace(backup, path)
+                elif op["staged"] is not None:
+                    staged = os.path.join(self.staging_dir, op["staged"])
+                    if not os.path.exists(staged) and os.path.exists(path):
+                        os.unlink(path)
+        self._clear()
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        os.makedirs(self.staging_dir, exist_ok=True)
+        tmp_path = f"{self._manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self._manifest_path)
+
+    def _clear(self):
+        self._dirs = []
+        self._operations = {}
+        self._staged_files = 0
+        if os.path.exists(self.staging_dir):
+            shutil.rmtree(self.staging_dir)
+
+
+class DryRunWriter(OutputWriter):
+    """Keeps all changes in memory and only reports them, the SkyTemple directory is never touched."""
+
+    written: Dict[str, bytes]
+    deleted: List[str]
+
+    def __init__(self):
+        super().__init__()
+        self.written = {}
+        self.deleted = []
+
+    def makedirs(self, path: str):
+        pass
+
+    def touch(self, path: str):
+        if path not in self.written and not os.path.exists(path):
+            self.written[path] = b""
+
+    def write(self, path: str, content: bytes):
+        self.written[path] = content
+
+    def unlink(self, path: str):
+        self.deleted.append(path)
+
+    def read(self, path: str) -> Optional[bytes]:
+        if path in self.written:
+            return self.written[path]
+        if path in self.deleted:
+            return None
+        return _read(path)
+
+    def report(self, diff: bool):
+        created = changed = unchanged = 0
+        for path, content in self.written.items():
+            before = _read(path)
+            if before is None:
+                created += 1
+                p_info(f"Create {path} ({len(content)} bytes).")
+            elif before != content:
+                changed += 1
+                p_info(f"Change {path} ({len(before)} -> {len(content)} bytes).")
+            else:
+                unchanged += 1
+                continue
+            if diff:
+                _echo_diff(path, before, content)
+        for path in self.deleted:
+            before = _read(path)
+            p_info(f"Delete {path} ({len(before or b'')} bytes).")
+            if diff:
+                _echo_diff(path, before, None)
+        p_info(
+            f"Dry run: {created} created, {changed} changed, {unchanged} unchanged, {len(self.deleted)} deleted."
+        )
+
+
+def _fsync_file(path: str):
+    """fsyncs a file or directory. Not every platform can fsync directories."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _read(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _echo_diff(path: str, before: Optional[bytes], after: Optional[bytes]):
+    lines = difflib.unified_diff(
+        _lines(before),
+        _lines(after),
+        fromfile=path if before is not None else "/dev/null",
+        tofile=path if after is not None else "/dev/null",
+    )
+    echo("".join(lines), nl=False)
+
+
+def _lines(content: Optional[bytes]) -> List[str]:
+    if content is None:
+        return []
+    lines = content.decode("utf-8", errors="replace").splitlines(keepends=True)
+    if len(lines) > 0 and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    return lines